@@ -1,8 +1,12 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
+from django.http import FileResponse, Http404
+from django.template.response import TemplateResponse
 
-from momus.models import UserProfile, Post, Comment, Notification, Message, Favorite, ReportedComment, ReportedPost
+from momus.models import UserProfile, Post, Comment, Notification, Message, Favorite, ReportedComment, ReportedPost,\
+                         PostVote, CommentVote
+from momus.profiling import create_store
 
 
 class UserProfileInline(admin.StackedInline):
@@ -14,6 +18,45 @@ class UserProfileInline(admin.StackedInline):
 class UserAdmin(BaseUserAdmin):
     inlines = (UserProfileInline, )
 
+
+def deactivate_comment_threads(modeladmin, request, queryset):
+    deactivated = queryset.deactivate_tree()
+    modeladmin.message_user(request, 'Ukryto komentarzy (z odpowiedziami): {}.'.format(deactivated))
+deactivate_comment_threads.short_description = 'Ukryj zaznaczone komentarze z odpowiedziami'
+
+
+def deactivate_reported_threads(modeladmin, request, queryset):
+    deactivated = Comment.objects.filter(pk__in=queryset.values('comment')).deactivate_tree()
+    queryset.update(is_pending=False)
+    modeladmin.message_user(request, 'Ukryto komentarzy (z odpowiedziami): {}.'.format(deactivated))
+deactivate_reported_threads.short_description = 'Ukryj zgłoszone komentarze z odpowiedziami'
+
+
+class CommentAdmin(admin.ModelAdmin):
+    actions = (deactivate_comment_threads, )
+
+
+class ReportedCommentAdmin(admin.ModelAdmin):
+    actions = (deactivate_reported_threads, )
+
 admin.site.unregister(User)
 admin.site.register(User, UserAdmin)
-admin.site.register((Post, Comment, Notification, Message, Favorite, ReportedComment, ReportedPost))
+admin.site.register(Comment, CommentAdmin)
+admin.site.register(ReportedComment, ReportedCommentAdmin)
+admin.site.register((Post, Notification, Message, Favorite, ReportedPost, PostVote, CommentVote))
+
+
+def profiles(request):
+    """Lista profili zapisanych przez ProfilingMiddleware, od najwolniejszego żądania."""
+    context = dict(admin.site.each_context(request), title='Profile żądań', profiles=create_store().list())
+    return TemplateResponse(request, 'admin/momus/profiles.html', context)
+
+
+def profile_download(request, profile_id):
+    try:
+        response = FileResponse(open(create_store().path(profile_id, 'prof'), 'rb'),
+                                content_type='application/octet-stream')
+    except (ValueError, FileNotFoundError):
+        raise Http404
+    response['Content-Disposition'] = 'attachment; filename="{}.prof"'.format(profile_id)
+    return response
@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+class TokenCache(object):
+    """
+    Tokeny z użytkownikiem i profilem, trzymane w cache przez `timeout` sekund.
+
+    Wpis jest unieważniany po usunięciu tokenu i po zapisie profilu (zapis użytkownika też zapisuje profil).
+    Przy cache lokalnym dla procesu pozostałe workery widzą zmianę najpóźniej po `timeout`.
+    """
+    key_template = 'auth-token:{}'
+
+    def __init__(self, alias='default', timeout=60):
+        self.alias = alias
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, key):
+        return self.cache.get(self.key_template.format(key))
+
+    def set(self, token):
+        self.cache.set(self.key_template.format(token.key), token, self.timeout)
+
+    def invalidate(self, *keys):
+        cache_keys = [self.key_template.format(key) for key in keys]
+        self.cache.delete_many(cache_keys)
+        transaction.on_commit(lambda: self.cache.delete_many(cache_keys))
+
+    def invalidate_user(self, user_id):
+        self.invalidate(*Token.objects.filter(user_id=user_id).values_list('key', flat=True))
+
+
+token_cache = TokenCache(timeout=getattr(settings, 'TOKEN_CACHE_TIMEOUT', 60))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication pobierające token, użytkownika i profil jednym zapytaniem, z cache."""
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is None:
+            try:
+                token = Token.objects.select_related('user__userprofile').get(key=key)
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Niepoprawny token.')
+            token_cache.set(token)
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed('Użytkownik nieaktywny lub usunięty.')
+
+        return token.user, token
@@ -0,0 +1,146 @@
+import re
+import time
+from hashlib import md5
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+
+from rest_framework.compat import is_authenticated
+
+from momus.models import Message, Notification
+
+
+ETAG = re.compile(r'\*|(?:W/)?"[^"]*"')
+
+
+def etag_matches(etag, if_none_match):
+    """Porównanie z listą z If-None-Match: `*` albo któryś ETag równy (słabo, bez prefiksu W/) podanemu."""
+    candidates = [candidate[2:] if candidate.startswith('W/') else candidate
+                  for candidate in ETAG.findall(if_none_match)]
+    return '*' in candidates or etag in candidates
+
+
+class ResponseCache(object):
+    """
+    Cache wyrenderowanych odpowiedzi dla anonimowych zapytań GET.
+
+    Klucz składa się z wersji, formatu odpowiedzi, ścieżki i posortowanego query stringa.
+    Unieważnienie polega na podbiciu wersji, więc stare wpisy po prostu wygasają.
+    """
+    version_key = 'response-cache:version'
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def key(self, request):
+        version = self.cache.get(self.version_key)
+        if version is None:
+            version = self._seed_version()
+        query = urlencode(sorted(request.query_params.lists()), doseq=True)
+        raw_key = '{}:{}?{}'.format(request.accepted_renderer.format, request.path, query)
+        return 'response-cache:{}:{}'.format(version, md5(raw_key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, response):
+        etag = '"{}"'.format(md5(response.content).hexdigest())
+        self.cache.set(key, (etag, response.content, response['Content-Type']))
+        return etag
+
+    def invalidate(self):
+        """Podbija wersję od razu i ponownie po commicie, żeby nie został wpis zapisany w trakcie transakcji."""
+        self._bump_version()
+        transaction.on_commit(self._bump_version)
+
+    def _bump_version(self):
+        try:
+            self.cache.incr(self.version_key)
+        except ValueError:
+            self._seed_version()
+
+    def _seed_version(self):
+        """
+        Wersja startuje od czasu w milisekundach, a nie od 0: po wyrzuceniu klucza wersji z cache
+        (np. cull w LocMemCache) nowa wersja nie trafi na wpisy zapisane przed unieważnieniem.
+        """
+        version = int(time.time() * 1000)
+        self.cache.add(self.version_key, version, timeout=None)
+        return self.cache.get(self.version_key, version)
+
+
+response_cache = ResponseCache(getattr(settings, 'RESPONSE_CACHE', 'default'))
+
+
+class UnreadCounter(object):
+    """Liczniki nieprzeczytanych powiadomień i wiadomości użytkownika, trzymane w cache do unieważnienia."""
+    key_template = 'unread-count:{}'
+
+    def __init__(self, alias='default', timeout=300):
+        self.alias = alias
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, profile_id):
+        key = self.key_template.format(profile_id)
+        counts = self.cache.get(key)
+        if counts is None:
+            counts = {
+                'notifications': Notification.objects.filter(user_id=profile_id, is_read=False).count(),
+                'messages': Message.objects.filter(reciver_id=profile_id, is_read=False).count(),
+            }
+            self.cache.set(key, counts, self.timeout)
+        return counts
+
+    def invalidate(self, *profile_ids):
+        keys = [self.key_template.format(profile_id) for profile_id in profile_ids]
+        self.cache.delete_many(keys)
+        transaction.on_commit(lambda: self.cache.delete_many(keys))
+
+
+unread_counter = UnreadCounter()
+
+
+class ResponseCacheMixin(object):
+    """Cache'uje odpowiedzi `list` i `retrieve` dla niezalogowanych, z obsługą ETag/If-None-Match."""
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super(ResponseCacheMixin, self).list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super(ResponseCacheMixin, self).retrieve, request, *args, **kwargs)
+
+    def cached_response(self, view_method, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or is_authenticated(request.user):
+            return view_method(request, *args, **kwargs)
+
+        key = response_cache.key(request)
+        cached = response_cache.get(key)
+        if cached is not None:
+            etag, content, content_type = cached
+            if etag_matches(etag, request.META.get('HTTP_IF_NONE_MATCH', '')):
+                response = HttpResponseNotModified()
+            else:
+                response = HttpResponse(content, content_type=content_type)
+            response['ETag'] = etag
+            return response
+
+        response = view_method(request, *args, **kwargs)
+        if response.status_code == 200:
+            response.add_post_render_callback(lambda rendered: self._store(key, rendered))
+        return response
+
+    @staticmethod
+    def _store(key, response):
+        response['ETag'] = response_cache.set(key, response)
+        return response
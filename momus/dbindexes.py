@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections
+
+from momus.models import Post, Comment, Message, Notification, ReportedPost, ReportedComment
+
+
+# Indeksy i wyzwalacze specyficzne dla PostgreSQL, których nie da się opisać w Meta modeli.
+POSTGRES_INDEXES = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS momus_post_tags_gin ON {post} USING gin (tags)',
+    # Indeksy częściowe obejmują tylko wiersze, o które pytają listy: aktywne, nieprzeczytane, oczekujące.
+    'CREATE INDEX IF NOT EXISTS momus_comment_active ON {comment} (post_id, create_date, id) WHERE is_active',
+    'CREATE INDEX IF NOT EXISTS momus_message_unread ON {message} (reciver_id, create_date, id) WHERE NOT is_read',
+    'CREATE INDEX IF NOT EXISTS momus_notification_unread ON {notification} (user_id, create_date, id) '
+    'WHERE NOT is_read',
+    'CREATE INDEX IF NOT EXISTS momus_reportedpost_pending ON {reported_post} (create_date, id) WHERE is_pending',
+    'CREATE INDEX IF NOT EXISTS momus_reportedcomment_pending ON {reported_comment} (create_date, id) '
+    'WHERE is_pending',
+    'CREATE INDEX IF NOT EXISTS momus_post_search_gin ON {post} USING gin (search_vector)',
+    'CREATE INDEX IF NOT EXISTS momus_comment_search_gin ON {comment} USING gin (search_vector)',
+    # Odpowiada wyrażeniu UPPER(username::text) LIKE UPPER(...) z lookupu icontains.
+    'CREATE INDEX IF NOT EXISTS momus_user_username_trgm ON {user} USING gin (UPPER(username::text) gin_trgm_ops)',
+)
+
+# Wektory wyszukiwania są utrzymywane przez wyzwalacze, więc obejmują też update() i bulk_create().
+POSTGRES_TRIGGERS = (
+    """
+    CREATE OR REPLACE FUNCTION momus_post_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('{config}', coalesce(NEW.title, '')), 'A') ||
+            setweight(to_tsvector('{config}', coalesce(array_to_string(NEW.tags, ' '), '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    'DROP TRIGGER IF EXISTS momus_post_search_vector ON {post}',
+    'CREATE TRIGGER momus_post_search_vector BEFORE INSERT OR UPDATE OF title, tags ON {post} '
+    'FOR EACH ROW EXECUTE PROCEDURE momus_post_search_vector()',
+    'UPDATE {post} SET title = title WHERE search_vector IS NULL',
+    """
+    CREATE OR REPLACE FUNCTION momus_comment_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := to_tsvector('{config}', coalesce(NEW.text, ''));
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    'DROP TRIGGER IF EXISTS momus_comment_search_vector ON {comment}',
+    'CREATE TRIGGER momus_comment_search_vector BEFORE INSERT OR UPDATE OF text ON {comment} '
+    'FOR EACH ROW EXECUTE PROCEDURE momus_comment_search_vector()',
+    'UPDATE {comment} SET text = text WHERE search_vector IS NULL',
+)
+
+
+def create_indexes(using='default'):
+    names = {
+        'post': Post._meta.db_table,
+        'comment': Comment._meta.db_table,
+        'user': User._meta.db_table,
+        'message': Message._meta.db_table,
+        'notification': Notification._meta.db_table,
+        'reported_post': ReportedPost._meta.db_table,
+        'reported_comment': ReportedComment._meta.db_table,
+        'config': getattr(settings, 'SEARCH_CONFIG', 'simple'),
+    }
+    with connections[using].cursor() as cursor:
+        for sql in POSTGRES_INDEXES + POSTGRES_TRIGGERS:
+            cursor.execute(sql.format(**names))
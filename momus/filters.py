@@ -6,10 +6,13 @@ from momus.models import Post, Comment, UserProfile, Message
 
 class ListFilter(Filter):
 
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('lookup_expr', 'contains')
+        super(ListFilter, self).__init__(*args, **kwargs)
+
     def filter(self, qs, value):
         if not value:
             return qs
-        self.lookup_expr = 'contains'
         values = value.split(',')
         return super(ListFilter, self).filter(qs, values)
 
@@ -33,11 +36,12 @@ class UserProfileFilter(FilterSet):
 
 class PostFilterSet(FilterSet):
     tags = ListFilter(name='tags')
+    tags_any = ListFilter(name='tags', lookup_expr='overlap')
     author = CharFilter(name='author__user__username')
 
     class Meta:
         model = Post
-        fields = ('tags', 'author', 'is_pending')
+        fields = ('tags', 'tags_any', 'author', 'is_pending')
 
 
 class CommentFilterSet(FilterSet):
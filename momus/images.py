@@ -0,0 +1,90 @@
+import atexit
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+
+from PIL import Image
+
+from momus.caches import response_cache
+
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+
+
+class ImagePipeline(object):
+    """
+    Generuje pomniejszone warianty obrazków (w formacie źródłowym i WebP) poza obsługą zapytania.
+
+    Zadania są zlecane po zatwierdzeniu transakcji do puli wątków; gotowe ścieżki wariantów trafiają
+    do pola `<pole>_variants` modelu, o ile obrazek nie został w międzyczasie podmieniony.
+    """
+
+    def __init__(self, variants=(('thumbnail', 320), ('medium', 1080)), max_workers=2, webp_quality=80):
+        self.variants = variants
+        self.max_workers = max_workers
+        self.webp_quality = webp_quality
+        self._executor = None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def schedule(self, instance, field_name):
+        model, pk, name = type(instance), instance.pk, getattr(instance, field_name).name
+        transaction.on_commit(lambda: self.executor.submit(self._process_in_worker, model, pk, field_name, name))
+
+    def process(self, model, pk, field_name, name):
+        with default_storage.open(name) as image_file:
+            image = Image.open(image_file)
+            image.load()
+        directory = os.path.join(os.path.dirname(name), 'variants', os.path.splitext(os.path.basename(name))[0])
+        variant_names = []
+        for variant, size in self.variants:
+            resized = image.copy()
+            resized.thumbnail((size, size), Image.LANCZOS)
+            for extension, content in self._encode(resized):
+                path = os.path.join(directory, '{}.{}'.format(variant, extension))
+                variant_names.append(default_storage.save(path, ContentFile(content)))
+        if model.objects.filter(pk=pk, **{field_name: name}).update(**{field_name + '_variants': variant_names}):
+            response_cache.invalidate()
+        return variant_names
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def _process_in_worker(self, model, pk, field_name, name):
+        try:
+            self.process(model, pk, field_name, name)
+        except Exception:
+            logger.exception('Nie udało się wygenerować wariantów obrazka %s.', name)
+        finally:
+            connection.close()
+
+    def _encode(self, image):
+        has_alpha = image.mode in ('RGBA', 'LA', 'P')
+        fallback = image if has_alpha or image.mode in ('RGB', 'L') else image.convert('RGB')
+        buffer = BytesIO()
+        fallback.save(buffer, 'PNG' if has_alpha else 'JPEG', optimize=True)
+        yield 'png' if has_alpha else 'jpg', buffer.getvalue()
+
+        buffer = BytesIO()
+        try:
+            image.convert('RGBA' if has_alpha else 'RGB').save(buffer, 'WEBP', quality=self.webp_quality)
+        except (IOError, KeyError):
+            return  # Pillow zbudowany bez libwebp
+        yield 'webp', buffer.getvalue()
+
+
+image_pipeline = ImagePipeline(**{key.lower(): value for key, value in getattr(settings, 'IMAGE_PIPELINE', {}).items()})
+atexit.register(image_pipeline.shutdown)
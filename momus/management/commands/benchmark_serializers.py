@@ -0,0 +1,41 @@
+import timeit
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from momus.models import Post, UserProfile
+from momus.rowserializers import get_row_serializer
+from momus.serializers import PostSerializer
+
+
+class Command(BaseCommand):
+    help = 'Porównuje czas serializacji strony postów przez PostSerializer i RowSerializer (dane są wycofywane).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[25, 100], help='Wielkości stron.')
+        parser.add_argument('--repeat', type=int, default=20, help='Liczba powtórzeń dla każdej wielkości.')
+
+    def handle(self, *args, **options):
+        sizes, repeat = options['sizes'], options['repeat']
+        with transaction.atomic():
+            self._seed(max(sizes))
+            row_serializer = get_row_serializer(PostSerializer)
+            queryset = Post.objects.select_related('author__user')
+            for size in sizes:
+                full = timeit.timeit(lambda: PostSerializer(list(queryset[:size]), many=True).data, number=repeat)
+                rows = timeit.timeit(
+                    lambda: row_serializer.to_representation(queryset.values(*row_serializer.columns)[:size]),
+                    number=repeat)
+                self.stdout.write('{:>4} postów: PostSerializer {:8.2f} ms, RowSerializer {:8.2f} ms ({:.1f}x)'.format(
+                    size, full / repeat * 1000, rows / repeat * 1000, full / rows))
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def _seed(count):
+        users = [User.objects.create_user(username='benchmark{}'.format(number)) for number in range(10)]
+        profiles = list(UserProfile.objects.filter(user__in=users))
+        Post.objects.bulk_create(
+            Post(author=profiles[number % len(profiles)], title='Benchmark {}'.format(number),
+                 slug='benchmark-{}'.format(number), image='images/benchmark.png', tags=['benchmark', 'momus'])
+            for number in range(count))
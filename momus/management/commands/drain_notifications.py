@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from momus.notifications import notification_queue
+
+
+class Command(BaseCommand):
+    help = 'Zapisuje do bazy powiadomienia odłożone przez kolejkę w katalogu NOTIFICATION_QUEUE["SPOOL_DIR"].'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Działa w trybie workera, aż do przerwania.')
+        parser.add_argument('--interval', type=float, default=1.0, help='Odstęp między przebiegami w sekundach.')
+
+    def handle(self, *args, **options):
+        if not notification_queue.spool_dir:
+            raise CommandError('Kolejka powiadomień nie ma ustawionego katalogu SPOOL_DIR.')
+        while True:
+            drained = notification_queue.drain()
+            if drained:
+                self.stdout.write('Zapisano {} powiadomień.'.format(drained))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
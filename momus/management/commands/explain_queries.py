@@ -0,0 +1,86 @@
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from momus.models import UserProfile, Post, Comment, Favorite, Message, Conversation, Notification, ReportedPost,\
+                         ReportedComment
+
+
+class Command(BaseCommand):
+    help = 'Uruchamia EXPLAIN ANALYZE na typowych zapytaniach widoków i kończy się błędem, ' \
+           'jeśli któreś z nich czyta tabelę sekwencyjnie.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--real-costs', action='store_true',
+                            help='Nie wyłącza enable_seqscan. Na małej bazie planista i tak wybierze skanowanie '
+                                 'sekwencyjne, więc bez tej opcji sprawdzane jest tylko, czy istnieje pasujący '
+                                 'indeks.')
+        parser.add_argument('--verbose-plans', action='store_true', help='Wypisuje pełne plany zapytań.')
+
+    def handle(self, *args, **options):
+        failures = []
+        with transaction.atomic(), connection.cursor() as cursor:
+            if not options['real_costs']:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            for name, queryset in self.canonical_queries():
+                sql, params = queryset.query.get_compiler(using=queryset.db).as_sql()
+                cursor.execute('EXPLAIN (ANALYZE, FORMAT JSON) ' + sql, params)
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                plan = plan[0]
+                scans = sorted(set(self.sequential_scans(plan['Plan'])))
+                if scans:
+                    failures.append(name)
+                    self.stdout.write(self.style.ERROR('{}: Seq Scan na {}'.format(name, ', '.join(scans))))
+                else:
+                    self.stdout.write('{}: {:.3f} ms'.format(name, plan['Execution Time']))
+                if options['verbose_plans']:
+                    self.stdout.write(json.dumps(plan['Plan'], indent=2))
+        if failures:
+            raise CommandError('Zapytania bez indeksu: {}.'.format(', '.join(failures)))
+        self.stdout.write(self.style.SUCCESS('Wszystkie zapytania korzystają z indeksów.'))
+
+    @classmethod
+    def sequential_scans(cls, node):
+        if node['Node Type'] == 'Seq Scan':
+            yield node['Relation Name']
+        for child in node.get('Plans', ()):
+            yield from cls.sequential_scans(child)
+
+    @staticmethod
+    def canonical_queries():
+        """Zapytania, które widoki wykonują przy każdym żądaniu, dla przykładowych obiektów z bazy."""
+        user_id = UserProfile.objects.values_list('pk', flat=True).first() or 0
+        partner_id = UserProfile.objects.exclude(pk=user_id).values_list('pk', flat=True).first() or 0
+        post = Post.objects.order_by('-comment_count').only('pk', 'slug').first() or Post(pk=0, slug='')
+        low, high = sorted((user_id, partner_id))
+        page = slice(0, 11)
+        return (
+            ('posts: feed', Post.objects.filter(is_pending=False).order_by('-create_date', '-id')[page]),
+            ('posts: keyset', Post.objects.filter(create_date__lt=timezone.now() - timedelta(days=1))
+                                          .order_by('-create_date', '-id')[page]),
+            ('posts: hot', Post.objects.filter(ranking__isnull=False).order_by('-ranking__hot', '-id')[page]),
+            ('posts: slug', Post.objects.filter(slug=post.slug)),
+            ('posts: tags', Post.objects.filter(tags__contains=['funny'])[page]),
+            ('posts: search', Post.objects.search('kot')[page]),
+            ('comments: post', Comment.objects.filter(post_id=post.pk, is_active=True).order_by('create_date', 'id')),
+            ('favorites: user', Favorite.objects.filter(user_id=user_id).order_by('-create_date', '-id')[page]),
+            ('messages: unread', Message.objects.filter(reciver_id=user_id, is_read=False)
+                                                .order_by('-create_date', '-id')[page]),
+            ('messages: history', Message.objects.filter(low_participant=low, high_participant=high)
+                                                 .order_by('-create_date', '-id')[page]),
+            ('conversations: user', Conversation.objects.filter(owner_id=user_id)
+                                                       .order_by('-last_message_date')[page]),
+            ('notifications: unread', Notification.objects.filter(user_id=user_id, is_read=False)
+                                                          .order_by('-create_date', '-id')[page]),
+            ('notifications: user', Notification.objects.filter(user_id=user_id).order_by('-create_date', '-id')[page]),
+            ('reported posts: pending', ReportedPost.objects.filter(is_pending=True)
+                                                            .order_by('-create_date', '-id')[page]),
+            ('reported comments: pending', ReportedComment.objects.filter(is_pending=True)
+                                                                  .order_by('-create_date', '-id')[page]),
+            ('users: autocomplete', UserProfile.objects.filter(user__username__icontains='kot')[page]),
+        )
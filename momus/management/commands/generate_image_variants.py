@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from momus.images import image_pipeline
+from momus.models import Post, UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Generuje brakujące warianty obrazków postów i zdjęć profilowych (synchronicznie).'
+
+    def handle(self, *args, **options):
+        for model, field_name in ((Post, 'image'), (UserProfile, 'photo')):
+            queryset = model.objects.filter(**{field_name + '_variants': []}).exclude(**{field_name: ''})\
+                                    .exclude(**{field_name + '__isnull': True}).values_list('pk', field_name)
+            processed = 0
+            for pk, name in queryset.iterator():
+                try:
+                    image_pipeline.process(model, pk, field_name, name)
+                except (IOError, OSError) as error:
+                    self.stderr.write('{} {}: {}'.format(model.__name__, pk, error))
+                else:
+                    processed += 1
+            self.stdout.write('{}: przetworzono {} obrazków.'.format(model.__name__, processed))
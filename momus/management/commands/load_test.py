@@ -0,0 +1,121 @@
+import random
+import threading
+import time
+from bisect import bisect
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import accumulate
+
+import requests
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rest_framework.authtoken.models import Token
+
+from momus.models import Post, Conversation
+
+
+# (nazwa, waga, ścieżka, czy wymaga tokenu) - proporcje zbliżone do ruchu z aplikacji.
+ENDPOINTS = (
+    ('posts', 20, '/api/posts/', False),
+    ('posts hot', 10, '/api/posts/?sort=hot', False),
+    ('post detail', 10, '/api/posts/{slug}/', False),
+    ('comments tree', 8, '/api/posts/{slug}/comments/tree/', False),
+    ('comments', 4, '/api/comments/?post={slug}', False),
+    ('users', 2, '/api/users/?startswith={prefix}', False),
+    ('search', 4, '/api/search/?q=kot', False),
+    ('tags', 2, '/api/tags/', False),
+    ('favorites', 4, '/api/favorites/', True),
+    ('messages', 6, '/api/messages/', True),
+    ('message history', 6, '/api/messages/{partner}/', True),
+    ('unread messages', 4, '/api/unread-messages/', True),
+    ('notifications', 6, '/api/notifications/', True),
+    ('unread count', 14, '/api/unread-count/', True),
+)
+
+
+class Command(BaseCommand):
+    help = 'Obciąża działający serwer żądaniami do endpointów API (dane z seed_dataset) i raportuje ' \
+           'przepustowość, percentyle czasu odpowiedzi i liczbę zapytań SQL na żądanie.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Adres serwera.')
+        parser.add_argument('--workers', type=int, default=8, help='Liczba równoległych klientów.')
+        parser.add_argument('--duration', type=float, default=30.0, help='Czas trwania w sekundach.')
+        parser.add_argument('--prefix', default='seed', help='Przedrostek danych z seed_dataset.')
+        parser.add_argument('--endpoints', nargs='+', help='Tylko wybrane endpointy (nazwy z raportu).')
+        parser.add_argument('--random-seed', type=int, default=0, help='Ziarno generatora, dla powtarzalności.')
+
+    def handle(self, *args, **options):
+        endpoints = [endpoint for endpoint in ENDPOINTS
+                     if not options['endpoints'] or endpoint[0] in options['endpoints']]
+        if not endpoints:
+            raise CommandError('Brak endpointów o podanych nazwach.')
+        samples = self.load_samples(options['prefix'])
+        self.random = random.Random(options['random_seed'])
+        self.lock = threading.Lock()
+        self.results = defaultdict(list)
+        deadline = time.monotonic() + options['duration']
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            workers = [executor.submit(self.worker, options['url'].rstrip('/'), endpoints, samples, deadline)
+                       for _ in range(options['workers'])]
+        for worker in workers:
+            worker.result()
+        self.report(time.monotonic() - started)
+
+    @staticmethod
+    def load_samples(prefix):
+        slugs = list(Post.objects.filter(slug__startswith=prefix).order_by('-comment_count')
+                                 .values_list('slug', flat=True)[:200])
+        tokens = list(Token.objects.filter(user__username__startswith='{}_user_'.format(prefix))
+                                   .values_list('key', 'user__userprofile')[:200])
+        if not slugs or not tokens:
+            raise CommandError('Brak danych z przedrostkiem "{}", najpierw uruchom seed_dataset.'.format(prefix))
+        partners = dict(Conversation.objects.filter(owner__in=[profile for _, profile in tokens])
+                                            .values_list('owner', 'partner__user__username'))
+        users = [(key, partners.get(profile, '')) for key, profile in tokens]
+        return {'prefix': prefix, 'slugs': slugs, 'users': users}
+
+    def worker(self, base_url, endpoints, samples, deadline):
+        session = requests.Session()
+        cumulative_weights = list(accumulate(endpoint[1] for endpoint in endpoints))
+        with self.lock:
+            rng = random.Random(self.random.random())
+        while time.monotonic() < deadline:
+            index = bisect(cumulative_weights, rng.random() * cumulative_weights[-1])
+            name, _, path, authenticated = endpoints[index]
+            token, partner = rng.choice(samples['users'])
+            url = base_url + path.format(slug=rng.choice(samples['slugs']), prefix=samples['prefix'], partner=partner)
+            headers = {'Authorization': 'Token ' + token} if authenticated else {}
+            started = time.monotonic()
+            try:
+                response = session.get(url, headers=headers)
+                status, queries = response.status_code, response.headers.get('X-Query-Count')
+            except requests.RequestException:
+                status, queries = None, None
+            elapsed = time.monotonic() - started
+            with self.lock:
+                self.results[name].append((elapsed, status, int(queries) if queries is not None else None))
+
+    def report(self, duration):
+        total = sum(len(results) for results in self.results.values())
+        self.stdout.write('{:<18}{:>8}{:>9}{:>9}{:>9}{:>9}{:>9}{:>9}'.format(
+            'endpoint', 'żądań', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'błędy', 'SQL'))
+        for name, results in sorted(self.results.items()):
+            times = sorted(elapsed * 1000 for elapsed, _, _ in results)
+            errors = sum(1 for _, status, _ in results if status is None or status >= 400)
+            queries = [count for _, _, count in results if count is not None]
+            self.stdout.write('{:<18}{:>8}{:>9.1f}{:>9.1f}{:>9.1f}{:>9.1f}{:>9}{:>9}'.format(
+                name, len(results), len(results) / duration, self.percentile(times, 50),
+                self.percentile(times, 95), self.percentile(times, 99), errors,
+                '{:.1f}'.format(sum(queries) / len(queries)) if queries else '-'))
+        self.stdout.write(self.style.SUCCESS('Razem {} żądań w {:.1f} s ({:.1f} req/s).'.format(
+            total, duration, total / duration)))
+
+    @staticmethod
+    def percentile(values, percent):
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))]
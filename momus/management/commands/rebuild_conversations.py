@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from momus.models import Conversation, Message
+
+
+class Command(BaseCommand):
+    help = 'Odbudowuje tabelę podsumowań rozmów na podstawie wszystkich wiadomości.'
+
+    def handle(self, *args, **options):
+        sql = """
+            INSERT INTO {conversation} (owner_id, partner_id, last_message_id, last_message_date, unread_count)
+            SELECT DISTINCT ON (owner_id, partner_id)
+                   owner_id, partner_id, id, create_date,
+                   COUNT(*) FILTER (WHERE is_unread) OVER (PARTITION BY owner_id, partner_id)
+            FROM (
+                SELECT sender_id AS owner_id, reciver_id AS partner_id, id, create_date, FALSE AS is_unread
+                FROM {message}
+                UNION ALL
+                SELECT reciver_id, sender_id, id, create_date, NOT is_read
+                FROM {message}
+            ) AS sides
+            ORDER BY owner_id, partner_id, create_date DESC, id DESC
+        """.format(conversation=Conversation._meta.db_table, message=Message._meta.db_table)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('DELETE FROM {}'.format(Conversation._meta.db_table))
+            cursor.execute(sql)
+            created = cursor.rowcount
+        self.stdout.write(self.style.SUCCESS('Zapisano {} podsumowań rozmów.'.format(created)))
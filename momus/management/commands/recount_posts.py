@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from momus.models import Post, Comment, Favorite
+
+
+class Command(BaseCommand):
+    help = 'Przelicza liczniki komentarzy i polubień postów jednym zapytaniem UPDATE.'
+
+    def handle(self, *args, **options):
+        sql = """
+            UPDATE {post} AS p
+            SET comment_count = counts.comment_count, favorite_count = counts.favorite_count
+            FROM (
+                SELECT p2.id,
+                       (SELECT COUNT(*) FROM {comment} c WHERE c.post_id = p2.id AND c.is_active) AS comment_count,
+                       (SELECT COUNT(*) FROM {favorite} f WHERE f.post_id = p2.id) AS favorite_count
+                FROM {post} p2
+            ) AS counts
+            WHERE p.id = counts.id
+              AND (p.comment_count <> counts.comment_count OR p.favorite_count <> counts.favorite_count)
+        """.format(post=Post._meta.db_table, comment=Comment._meta.db_table, favorite=Favorite._meta.db_table)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql)
+            updated = cursor.rowcount
+        self.stdout.write(self.style.SUCCESS('Poprawiono liczniki {} postów.'.format(updated)))
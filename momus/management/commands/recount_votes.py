@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from momus.models import PostVote, CommentVote
+
+
+class Command(BaseCommand):
+    help = 'Przelicza oceny postów i komentarzy z sumy głosów, jednym zapytaniem UPDATE na tabelę.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            posts = PostVote.objects.recount()
+            comments = CommentVote.objects.recount()
+        self.stdout.write(self.style.SUCCESS('Poprawiono oceny {} postów i {} komentarzy.'.format(posts, comments)))
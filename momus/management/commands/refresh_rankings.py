@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from momus.caches import response_cache
+from momus.models import Post, PostRanking, Favorite, Comment
+
+
+class Command(BaseCommand):
+    help = 'Przelicza tabelę rankingów postów (hot, top, rising). ' \
+           'Uruchamiane okresowo (cron) albo jako worker z --loop.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Działa w trybie workera, aż do przerwania.')
+        parser.add_argument('--interval', type=float, default=300.0, help='Odstęp między przebiegami w sekundach.')
+        parser.add_argument('--gravity', type=float, default=1.8, help='Szybkość wygasania wyniku z wiekiem posta.')
+        parser.add_argument('--rising-window', type=float, default=6.0,
+                            help='Okno (w godzinach) aktywności liczonej do wyniku "rising".')
+
+    def handle(self, *args, **options):
+        while True:
+            count = self.refresh(options['gravity'], options['rising_window'])
+            self.stdout.write('Zapisano rankingi {} postów.'.format(count))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    @staticmethod
+    def refresh(gravity=1.8, rising_window=6.0):
+        """
+        top to zaangażowanie (ocena + 2 * polubienia + komentarze), hot to zaangażowanie wygaszane
+        z wiekiem posta, a rising to świeża aktywność (polubienia i komentarze z okna) wygaszana tak samo.
+        """
+        sql = """
+            INSERT INTO {ranking} (post_id, hot, top, rising)
+            SELECT post.id,
+                   score.value / decay.value,
+                   score.value,
+                   (2 * COALESCE(favorite.recent, 0) + COALESCE(comment.recent, 0)) / decay.value
+            FROM {post} post
+            CROSS JOIN LATERAL (
+                SELECT (post.rate + 2 * post.favorite_count + post.comment_count)::float8 AS value
+            ) score
+            CROSS JOIN LATERAL (
+                SELECT power(EXTRACT(EPOCH FROM now() - post.create_date) / 3600 + 2, %(gravity)s) AS value
+            ) decay
+            LEFT JOIN (
+                SELECT post_id, COUNT(*) AS recent FROM {favorite}
+                WHERE create_date > now() - %(window)s * interval '1 hour'
+                GROUP BY post_id
+            ) favorite ON favorite.post_id = post.id
+            LEFT JOIN (
+                SELECT post_id, COUNT(*) AS recent FROM {comment}
+                WHERE is_active AND create_date > now() - %(window)s * interval '1 hour'
+                GROUP BY post_id
+            ) comment ON comment.post_id = post.id
+        """.format(ranking=PostRanking._meta.db_table, post=Post._meta.db_table,
+                   favorite=Favorite._meta.db_table, comment=Comment._meta.db_table)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('DELETE FROM {}'.format(PostRanking._meta.db_table))
+            cursor.execute(sql, {'gravity': gravity, 'window': rising_window})
+            response_cache.invalidate()
+            return cursor.rowcount
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from momus.models import Post, TagCount
+
+
+class Command(BaseCommand):
+    help = 'Przelicza tabelę popularności tagów. Uruchamiane okresowo (cron) albo jako worker z --loop.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Działa w trybie workera, aż do przerwania.')
+        parser.add_argument('--interval', type=float, default=300.0, help='Odstęp między przebiegami w sekundach.')
+
+    def handle(self, *args, **options):
+        while True:
+            self.stdout.write('Zapisano {} tagów.'.format(self.refresh()))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    @staticmethod
+    def refresh():
+        sql = """
+            INSERT INTO {tag_count} (tag, count)
+            SELECT tag, COUNT(DISTINCT post.id)
+            FROM {post} post, unnest(post.tags) AS tag
+            WHERE tag <> ''
+            GROUP BY tag
+        """.format(tag_count=TagCount._meta.db_table, post=Post._meta.db_table)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('DELETE FROM {}'.format(TagCount._meta.db_table))
+            cursor.execute(sql)
+            return cursor.rowcount
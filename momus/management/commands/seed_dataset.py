@@ -0,0 +1,134 @@
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from rest_framework.authtoken.models import Token
+
+from momus.models import UserProfile, Post, Comment, Favorite, Message, Notification
+
+
+TAGS = ('kot', 'pies', 'śmieszne', 'polityka', 'sport', 'gry', 'film', 'muzyka', 'nauka', 'jedzenie', 'praca',
+        'szkoła', 'auto', 'podróże', 'memy', 'technologia', 'zwierzęta', 'historia', 'sztuka', 'pogoda')
+WORDS = ('kot', 'pies', 'dzień', 'wieczór', 'szef', 'mama', 'kolega', 'telefon', 'komputer', 'pizza', 'kawa',
+         'poniedziałek', 'weekend', 'urlop', 'deszcz', 'autobus', 'mecz', 'egzamin', 'sąsiad', 'internet')
+
+
+class Command(BaseCommand):
+    help = 'Zasiewa bazę realistycznym zbiorem danych (bulk_create) do testów wydajności i explain_queries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0,
+                            help='Mnożnik wielkości: 1.0 to 1000 użytkowników, 10 000 postów, 50 000 komentarzy, '
+                                 '20 000 wiadomości i 50 000 powiadomień.')
+        parser.add_argument('--prefix', default='seed', help='Przedrostek nazw użytkowników i slugów.')
+        parser.add_argument('--password', default='seed123password', help='Hasło wszystkich użytkowników.')
+        parser.add_argument('--days', type=int, default=90, help='Rozrzut dat utworzenia w dniach.')
+        parser.add_argument('--random-seed', type=int, default=0, help='Ziarno generatora, dla powtarzalności.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Wielkość paczek bulk_create.')
+
+    def handle(self, *args, **options):
+        prefix, scale = options['prefix'], options['scale']
+        if User.objects.filter(username__startswith='{}_user_'.format(prefix)).exists():
+            raise CommandError('Dane z przedrostkiem "{}" już istnieją, użyj innego --prefix.'.format(prefix))
+        self.random = random.Random(options['random_seed'])
+        self.batch_size = options['batch_size']
+        counts = {name: max(1, int(count * scale)) for name, count in (
+            ('users', 1000), ('posts', 10000), ('comments', 50000), ('messages', 20000), ('notifications', 50000))}
+
+        with transaction.atomic():
+            profiles = self.seed_users(prefix, counts['users'], options['password'])
+            posts = self.seed_posts(prefix, profiles, counts['posts'])
+            self.seed_comments(profiles, posts, counts['comments'])
+            self.seed_favorites(profiles, posts)
+            self.seed_messages(profiles, counts['messages'])
+            self.seed_notifications(profiles, posts, counts['notifications'])
+            self.spread_dates(options['days'], posts[0].pk, profiles[0].pk)
+
+        for command in ('recount_posts', 'rebuild_conversations', 'refresh_tag_counts', 'refresh_rankings'):
+            call_command(command, stdout=self.stdout)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.stdout.write(self.style.SUCCESS('Zasiano dane: {}.'.format(
+            ', '.join('{} {}'.format(count, name) for name, count in sorted(counts.items())))))
+
+    def bulk_create(self, model, objects):
+        return model.objects.bulk_create(objects, batch_size=self.batch_size)
+
+    def seed_users(self, prefix, count, password):
+        password = make_password(password)
+        users = self.bulk_create(User, (
+            User(username='{}_user_{}'.format(prefix, number), email='{}_user_{}@example.com'.format(prefix, number),
+                 first_name='Jan', last_name='Testowy {}'.format(number), password=password)
+            for number in range(count)))
+        self.bulk_create(Token, (Token(user=user, key=Token.generate_key()) for user in users))
+        return self.bulk_create(UserProfile, (
+            UserProfile(user=user, city=self.random.choice(('Warszawa', 'Kraków', 'Gdańsk', 'Poznań', None)))
+            for user in users))
+
+    def seed_posts(self, prefix, profiles, count):
+        return self.bulk_create(Post, (
+            Post(author=self.random.choice(profiles), title=self.sentence(3, 6).capitalize()[:64],
+                 slug='{}-post-{}'.format(prefix, number), image='images/seed.png',
+                 tags=self.random.sample(TAGS, self.random.randint(1, 5)),
+                 rate=min(int(self.random.paretovariate(1.2)), 10000), is_pending=self.random.random() < 0.8)
+            for number in range(count)))
+
+    def seed_comments(self, profiles, posts, count):
+        """Komentarze w drzewach: co trzeci jest odpowiedzią na komentarz z poprzedniego poziomu."""
+        roots = self.bulk_create(Comment, (
+            Comment(author=self.random.choice(profiles), post=self.popular(posts), text=self.sentence(4, 20))
+            for _ in range(count - count // 3)))
+        parents, remaining = roots, count // 3
+        while remaining and parents:
+            level = min(remaining, max(1, len(parents) // 2))
+            parents = self.bulk_create(Comment, (
+                Comment(author=self.random.choice(profiles), post_id=parent.post_id, parent=parent,
+                        text=self.sentence(4, 20))
+                for parent in self.random.sample(parents, min(level, len(parents)))))
+            remaining -= len(parents)
+
+    def seed_favorites(self, profiles, posts):
+        pairs = {(self.random.choice(profiles).pk, self.popular(posts).pk) for _ in range(len(posts))}
+        self.bulk_create(Favorite, (Favorite(user_id=user_id, post_id=post_id) for user_id, post_id in pairs))
+
+    def seed_messages(self, profiles, count):
+        """Wiadomości skupione w rozmowach: każdy użytkownik pisze z kilkoma stałymi znajomymi."""
+        def message():
+            index = self.random.randrange(len(profiles))
+            sender = profiles[index]
+            reciver = profiles[(index + self.random.randint(1, 5)) % len(profiles)]
+            low, high = sorted((sender.pk, reciver.pk))
+            return Message(sender=sender, reciver=reciver, title=self.sentence(1, 4)[:64], text=self.sentence(5, 40),
+                           is_read=self.random.random() < 0.7, low_participant=low, high_participant=high)
+        self.bulk_create(Message, (message() for _ in range(count)))
+
+    def seed_notifications(self, profiles, posts, count):
+        types = (Notification.COMMENT, Notification.MESSAGE, Notification.TO_MAIN)
+        self.bulk_create(Notification, (
+            Notification(user=self.random.choice(profiles), type=self.random.choice(types),
+                         data=self.random.choice(posts).slug, is_read=self.random.random() < 0.6)
+            for _ in range(count)))
+
+    def spread_dates(self, days, first_post_id, first_profile_id):
+        """bulk_create ustawia auto_now_add na teraz, więc daty są rozrzucane osobnym UPDATE na tabelę."""
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE {} SET create_date = now() - random() * %s * interval \'1 day\' WHERE id >= %s'
+                           .format(Post._meta.db_table), [days, first_post_id])
+            for model in (Comment, Favorite):
+                cursor.execute('UPDATE {} AS t SET create_date = p.create_date + random() * (now() - p.create_date) '
+                               'FROM {} AS p WHERE t.post_id = p.id AND p.id >= %s'
+                               .format(model._meta.db_table, Post._meta.db_table), [first_post_id])
+            for model, column in ((Message, 'sender_id'), (Notification, 'user_id')):
+                cursor.execute('UPDATE {} SET create_date = now() - random() * %s * interval \'1 day\' '
+                               'WHERE {} >= %s'.format(model._meta.db_table, column), [days, first_profile_id])
+
+    def popular(self, posts):
+        """Post wybrany z rozkładem potęgowym, tak jak ruch w prawdziwym serwisie."""
+        return posts[min(int(self.random.paretovariate(1.1)) - 1, len(posts) - 1) * 7919 % len(posts)]
+
+    def sentence(self, minimum, maximum):
+        return ' '.join(self.random.choice(WORDS) for _ in range(self.random.randint(minimum, maximum)))
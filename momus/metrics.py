@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection
+
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+METRICS = (
+    ('request_seconds', 'Czas obsługi żądania.', TIME_BUCKETS),
+    ('db_queries', 'Liczba zapytań SQL na żądanie.', COUNT_BUCKETS),
+    ('db_seconds', 'Czas zapytań SQL na żądanie.', TIME_BUCKETS),
+    ('view_python_seconds', 'Czas widoku poza zapytaniami SQL (uwierzytelnianie, uprawnienia, limity, '
+                            'serializacja).', TIME_BUCKETS),
+    ('render_seconds', 'Czas renderowania odpowiedzi.', TIME_BUCKETS),
+    ('response_bytes', 'Rozmiar odpowiedzi.', SIZE_BUCKETS),
+)
+
+
+class MetricsRegistry(object):
+    """
+    Histogramy metryk żądań per trasa (np. `PostViewSet.list`), zbierane w pamięci procesu.
+
+    Jeśli ustawiono `directory`, każdy proces co `flush_interval` sekund zapisuje swój stan do pliku
+    `metrics-<pid>.json`, a eksport sumuje pliki wszystkich procesów (jak tryb multiprocess Prometheusa).
+    """
+
+    def __init__(self, directory=None, flush_interval=5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.buckets = {name: buckets for name, _, buckets in METRICS}
+        self._values = self._empty()
+        self._lock = threading.Lock()
+        self._flushed = time.monotonic()
+
+    def observe(self, route, **values):
+        with self._lock:
+            for name, value in values.items():
+                if value is None:
+                    continue
+                histogram = self._values[name][route]
+                histogram['buckets'][bisect_left(self.buckets[name], value)] += 1
+                histogram['sum'] += value
+                histogram['count'] += 1
+            should_flush = self.directory and time.monotonic() - self._flushed >= self.flush_interval
+        if should_flush:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            self._flushed = time.monotonic()
+            data = json.dumps(self._values)
+        path = os.path.join(self.directory, 'metrics-{}.json'.format(os.getpid()))
+        with open(path + '.tmp', 'w') as metrics_file:
+            metrics_file.write(data)
+        os.replace(path + '.tmp', path)
+
+    def collect(self):
+        """Zsumowane histogramy wszystkich procesów (albo tylko bieżącego, bez `directory`)."""
+        if not self.directory:
+            with self._lock:
+                return json.loads(json.dumps(self._values))
+        self.flush()
+        total = self._empty()
+        for name in os.listdir(self.directory):
+            if not (name.startswith('metrics-') and name.endswith('.json')):
+                continue
+            with open(os.path.join(self.directory, name)) as metrics_file:
+                values = json.load(metrics_file)
+            for metric, routes in values.items():
+                for route, histogram in routes.items():
+                    merged = total[metric][route]
+                    merged['buckets'] = [a + b for a, b in zip(merged['buckets'], histogram['buckets'])]
+                    merged['sum'] += histogram['sum']
+                    merged['count'] += histogram['count']
+        return total
+
+    def render(self):
+        """Eksport w formacie tekstowym Prometheusa."""
+        values = self.collect()
+        lines = []
+        for name, help_text, buckets in METRICS:
+            lines.append('# HELP momus_{} {}'.format(name, help_text))
+            lines.append('# TYPE momus_{} histogram'.format(name))
+            for route, histogram in sorted(values.get(name, {}).items()):
+                label = 'route="{}"'.format(route.replace('\\', '\\\\').replace('"', '\\"'))
+                cumulative = 0
+                for bound, count in zip(buckets + ('+Inf', ), histogram['buckets']):
+                    cumulative += count
+                    lines.append('momus_{}_bucket{{{},le="{}"}} {}'.format(name, label, bound, cumulative))
+                lines.append('momus_{}_sum{{{}}} {}'.format(name, label, histogram['sum']))
+                lines.append('momus_{}_count{{{}}} {}'.format(name, label, histogram['count']))
+        return '\n'.join(lines) + '\n'
+
+    def _empty(self):
+        return {name: defaultdict(lambda size=len(buckets): {'buckets': [0] * (size + 1), 'sum': 0, 'count': 0})
+                for name, _, buckets in METRICS}
+
+
+_config = getattr(settings, 'METRICS', {})
+metrics_registry = MetricsRegistry(_config.get('DIRECTORY'), _config.get('FLUSH_INTERVAL', 5.0))
+
+
+class MetricsMixin(object):
+    """
+    Przypisuje żądanie do trasy `Widok.akcja` oraz mierzy czas widoku poza zapytaniami SQL (uwierzytelnianie,
+    uprawnienia, limity i serializacja razem) i czas renderowania; MetricsMiddleware zapisuje te wartości
+    razem z resztą metryk żądania.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        first_query = len(connection.queries_log)
+        started = time.perf_counter()
+        response = super(MetricsMixin, self).dispatch(request, *args, **kwargs)
+        view_seconds = time.perf_counter() - started
+        db_seconds = sum(float(query['time']) for query in islice(connection.queries_log, first_query, None))
+
+        render_seconds = None
+        if hasattr(response, 'render') and not response.is_rendered:
+            started = time.perf_counter()
+            response.render()
+            render_seconds = time.perf_counter() - started
+
+        request.metrics = {
+            'route': '{}.{}'.format(type(self).__name__, getattr(self, 'action', None) or request.method.lower()),
+            'view_python_seconds': max(view_seconds - db_seconds, 0.0),
+            'render_seconds': render_seconds,
+        }
+        return response
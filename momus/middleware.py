@@ -0,0 +1,83 @@
+import logging
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection
+
+from momus.metrics import metrics_registry
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCountMiddleware(object):
+    """
+    Dodaje do odpowiedzi nagłówek X-Query-Count z liczbą zapytań SQL wykonanych przy jej obsłudze.
+
+    Włączane ustawieniem QUERY_COUNT_HEADER; korzysta z niego `manage.py load_test`.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'QUERY_COUNT_HEADER', False):
+            return self.get_response(request)
+        force_debug_cursor = connection.force_debug_cursor
+        connection.force_debug_cursor = True
+        first_query = len(connection.queries_log)
+        try:
+            response = self.get_response(request)
+            response['X-Query-Count'] = len(connection.queries_log) - first_query
+        finally:
+            connection.force_debug_cursor = force_debug_cursor
+        return response
+
+
+class MetricsMiddleware(object):
+    """
+    Zapisuje metryki każdego żądania (czas, liczba i czas zapytań SQL, rozmiar odpowiedzi oraz czasy
+    z MetricsMixin) w histogramach `metrics_registry` i loguje żądania wolniejsze niż METRICS['SLOW_REQUEST_MS'].
+
+    Czasy zapytań pochodzą z `connection.queries_log`, więc włączone metryki kierują każde zapytanie przez
+    CursorDebugWrapper (jak DEBUG); stąd METRICS['ENABLED'] jest domyślnie wyłączone.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = getattr(settings, 'METRICS', {})
+        if not config.get('ENABLED', False):
+            return self.get_response(request)
+        force_debug_cursor = connection.force_debug_cursor
+        connection.force_debug_cursor = True
+        first_query = len(connection.queries_log)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            connection.force_debug_cursor = force_debug_cursor
+        request_seconds = time.perf_counter() - started
+
+        queries = list(islice(connection.queries_log, first_query, None))
+        db_seconds = sum(float(query['time']) for query in queries)
+        view_metrics = getattr(request, 'metrics', {})
+        route = view_metrics.get('route') or self.route(request)
+        metrics_registry.observe(
+            route, request_seconds=request_seconds, db_queries=len(queries), db_seconds=db_seconds,
+            view_python_seconds=view_metrics.get('view_python_seconds'),
+            render_seconds=view_metrics.get('render_seconds'),
+            response_bytes=None if response.streaming else len(response.content))
+
+        if request_seconds * 1000 >= config.get('SLOW_REQUEST_MS', 500):
+            logger.warning('Wolne żądanie %s %s (%s): %.0f ms, %d zapytań SQL (%.0f ms).', request.method,
+                           request.get_full_path(), route, request_seconds * 1000, len(queries), db_seconds * 1000)
+        return response
+
+    @staticmethod
+    def route(request):
+        if request.resolver_match is None:
+            return 'unresolved'
+        return '{}.{}'.format(request.resolver_match.func.__name__, request.method.lower())
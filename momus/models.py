@@ -1,11 +1,80 @@
-from django.db import models
+import copy
+import re
+
+from django.conf import settings
+from django.db import models, connection, transaction, IntegrityError
+from django.db.models import Count, F
 from django.contrib.auth.models import User
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
+
+
+NOT_LOADED = object()
+
+
+class DirtyFieldsMixin(object):
+    """
+    Śledzi zmienione pola modelu, dzięki czemu `save()` istniejącego obiektu zapisuje tylko zmienione
+    kolumny (update_fields), a gdy nic się nie zmieniło, nie wykonuje żadnego zapytania ani sygnałów.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(DirtyFieldsMixin, self).__init__(*args, **kwargs)
+        self._snapshot_fields()
+
+    def get_dirty_fields(self):
+        """Nazwy pól, których wartość różni się od wczytanej z bazy (albo ostatnio zapisanej)."""
+        return [field.attname for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname in self.__dict__
+                and self._tracked_value(field) != self._snapshot.get(field.attname, NOT_LOADED)]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            dirty_fields = self.get_dirty_fields()
+            if not dirty_fields:
+                return
+            kwargs['update_fields'] = dirty_fields
+        super(DirtyFieldsMixin, self).save(*args, **kwargs)
+        self._snapshot_fields(kwargs.get('update_fields'))
+
+    def refresh_from_db(self, *args, **kwargs):
+        super(DirtyFieldsMixin, self).refresh_from_db(*args, **kwargs)
+        self._snapshot_fields(kwargs.get('fields'))
+
+    def _snapshot_fields(self, names=None):
+        """Zapamiętuje wartości pól; z `names` tylko tych zapisanych, żeby pozostałe zmiany zostały brudne."""
+        if names is None:
+            self._snapshot = {}
+        else:
+            names = set(names)
+        self._snapshot.update(
+            (field.attname, self._tracked_value(field)) for field in self._meta.concrete_fields
+            if not field.primary_key and field.attname in self.__dict__
+            and (names is None or field.name in names or field.attname in names))
+
+    def _tracked_value(self, field):
+        value = self.__dict__[field.attname]
+        if isinstance(field, models.FileField):
+            return getattr(value, 'name', value), getattr(value, '_committed', True)
+        if isinstance(value, (list, dict)):
+            return copy.deepcopy(value)
+        return value
 
 
-class UserProfile(models.Model):
+class SearchMixin(object):
+
+    def search(self, text):
+        """Wyniki dopasowane do `text` po wektorze `search_vector`, od najtrafniejszych."""
+        query = SearchQuery(text, config=getattr(settings, 'SEARCH_CONFIG', 'simple'))
+        return self.filter(search_vector=query).annotate(rank=SearchRank(F('search_vector'), query))\
+                   .order_by('-rank', '-id')
+
+
+class UserProfile(DirtyFieldsMixin, models.Model):
     user = models.OneToOneField(User, verbose_name='Użytkownik', on_delete=models.CASCADE)
     photo = models.ImageField(verbose_name='Zdjęcie', upload_to='user_photos', max_length=255, blank=True, null=True)
+    photo_variants = ArrayField(models.CharField(max_length=255), verbose_name='Warianty zdjęcia', default=list,
+                                blank=True, editable=False)
     city = models.CharField(verbose_name='Miejscowość', max_length=128, blank=True, null=True)
     description = models.TextField(verbose_name='Opis', max_length=2048, blank=True, null=True)
     birth_date = models.DateField(verbose_name='Data urodzenia', null=True, blank=True)
@@ -18,15 +87,56 @@ class UserProfile(models.Model):
         verbose_name_plural = 'Profile użytkowników'
 
 
-class Post(models.Model):
+class PostQuerySet(SearchMixin, models.QuerySet):
+
+    def next_free_slug(self, base):
+        """Zwraca `base` albo `base-N` z kolejnym wolnym numerem, wyznaczonym jednym zapytaniem."""
+        sql = """
+            SELECT MAX(CASE WHEN slug = %(base)s THEN 0 ELSE substring(slug FROM '-([0-9]+)$')::numeric END)
+            FROM {table}
+            WHERE slug = %(base)s OR (slug LIKE %(prefix)s AND slug ~ %(pattern)s)
+        """.format(table=self.model._meta.db_table)
+        params = {
+            'base': base,
+            'prefix': base.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '-%',
+            'pattern': '^{}-[0-9]+$'.format(re.escape(base)),
+        }
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            number = cursor.fetchone()[0]
+        return base if number is None else '{}-{}'.format(base, number + 1)
+
+    def create_with_slug(self, base, attempts=5, **fields):
+        """
+        Tworzy post z pierwszym wolnym slugiem opartym na `base`. Gdy równoległe żądanie zajmie ten sam
+        slug, zapis w savepoincie się wycofuje i numer jest wyznaczany od nowa.
+        """
+        for attempt in range(attempts):
+            slug = self.next_free_slug(base)
+            try:
+                with transaction.atomic():
+                    return self.create(slug=slug, **fields)
+            except IntegrityError:
+                if attempt == attempts - 1 or not self.filter(slug=slug).exists():
+                    raise
+
+
+class Post(DirtyFieldsMixin, models.Model):
     author = models.ForeignKey(UserProfile, verbose_name='Autor')
     title = models.CharField(verbose_name='Tytuł', max_length=64)
     slug = models.SlugField(unique=True)
     image = models.ImageField(verbose_name='Obrazek', upload_to='images', max_length=255)
-    rate = models.SmallIntegerField(verbose_name='Ocena', default=0)
+    image_variants = ArrayField(models.CharField(max_length=255), verbose_name='Warianty obrazka', default=list,
+                                blank=True, editable=False)
+    rate = models.IntegerField(verbose_name='Ocena', default=0)
     tags = ArrayField(models.CharField(max_length=20, blank=True), 5, verbose_name='Tagi')
     is_pending = models.BooleanField(verbose_name='Czy oczekujący', default=1)
+    comment_count = models.PositiveIntegerField(verbose_name='Liczba komentarzy', default=0, editable=False)
+    favorite_count = models.PositiveIntegerField(verbose_name='Liczba polubień', default=0, editable=False)
     create_date = models.DateTimeField(auto_now_add=True, verbose_name='Data utworzenia')
+    search_vector = SearchVectorField(verbose_name='Wektor wyszukiwania', null=True, editable=False)
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self):
         return self.slug
@@ -34,7 +144,24 @@ class Post(models.Model):
     class Meta:
         verbose_name = 'Post'
         verbose_name_plural = 'Posty'
-        ordering = ['-create_date']
+        ordering = ['-create_date', '-id']
+        index_together = (('create_date', 'id'), ('is_pending', 'create_date', 'id'))
+
+
+class PostRanking(models.Model):
+    post = models.OneToOneField(Post, verbose_name='Post', primary_key=True, related_name='ranking',
+                                on_delete=models.CASCADE)
+    hot = models.FloatField(verbose_name='Wynik "hot"')
+    top = models.FloatField(verbose_name='Wynik "top"')
+    rising = models.FloatField(verbose_name='Wynik "rising"')
+
+    def __str__(self):
+        return 'Ranking {}'.format(self.post_id)
+
+    class Meta:
+        verbose_name = 'Ranking posta'
+        verbose_name_plural = 'Rankingi postów'
+        index_together = (('hot', 'post'), ('top', 'post'), ('rising', 'post'))
 
 
 class Favorite(models.Model):
@@ -45,7 +172,58 @@ class Favorite(models.Model):
     class Meta:
         verbose_name = 'Ulubiony'
         verbose_name_plural = 'Ulubione'
-        ordering = ['-create_date']
+        ordering = ['-create_date', '-id']
+        index_together = (('user', 'create_date', 'id'), )
+
+
+class CommentQuerySet(SearchMixin, models.QuerySet):
+
+    def with_descendants(self):
+        """Komentarze z querysetu razem z całymi poddrzewami odpowiedzi, wyznaczone jednym zapytaniem rekurencyjnym."""
+        sql, params = self._subtree_sql()
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        return self.model.objects.extra(where=['{}.id IN ({})'.format(table, sql)], params=params)
+
+    def delete_tree(self):
+        """Usuwa komentarze z odpowiedziami stałą liczbą zapytań, niezależnie od wielkości wątku."""
+        with transaction.atomic():
+            subtree = self.with_descendants()
+            removed = self._active_per_post(subtree)
+            ReportedComment.objects.filter(comment__in=subtree).delete()
+            CommentVote.objects.filter(comment__in=subtree).delete()
+            sql, params = self._subtree_sql()
+            with connection.cursor() as cursor:
+                cursor.execute('DELETE FROM {} WHERE id IN ({})'.format(self.model._meta.db_table, sql), params)
+                deleted = cursor.rowcount
+            self._decrement_comment_counts(removed)
+        return deleted
+
+    def deactivate_tree(self):
+        """Ukrywa (is_active=False) komentarze razem z odpowiedziami, bez usuwania ich z bazy."""
+        with transaction.atomic():
+            subtree = self.with_descendants().filter(is_active=True)
+            removed = self._active_per_post(subtree)
+            deactivated = subtree.update(is_active=False)
+            self._decrement_comment_counts(removed)
+        return deactivated
+
+    def _subtree_sql(self):
+        roots_sql, params = self.order_by().values('pk').query.sql_with_params()
+        sql = 'WITH RECURSIVE subtree(id) AS ({roots} UNION SELECT c.id FROM {table} c ' \
+              'JOIN subtree s ON c.parent_id = s.id) SELECT id FROM subtree'
+        return sql.format(roots=roots_sql, table=self.model._meta.db_table), params
+
+    @staticmethod
+    def _active_per_post(subtree):
+        return list(subtree.filter(is_active=True).order_by().values_list('post').annotate(Count('id')))
+
+    @staticmethod
+    def _decrement_comment_counts(removed):
+        """Zmniejsza liczniki komentarzy z pominięciem sygnałów, więc unieważnia też cache odpowiedzi"""
+        from momus.caches import response_cache  # momus.caches importuje modele
+        for post_id, count in removed:
+            Post.objects.filter(pk=post_id).update(comment_count=F('comment_count') - count)
+        response_cache.invalidate()
 
 
 class Comment(models.Model):
@@ -53,9 +231,12 @@ class Comment(models.Model):
     post = models.ForeignKey(Post, verbose_name='Post')
     parent = models.ForeignKey('self', verbose_name='Rodzic', null=True, default=None)
     text = models.CharField(verbose_name='Tekst', max_length=255)
-    rate = models.SmallIntegerField(verbose_name='Ocena', default=0)
+    rate = models.IntegerField(verbose_name='Ocena', default=0)
     is_active = models.BooleanField(verbose_name='Czy aktywny', default=True)
     create_date = models.DateTimeField(auto_now_add=True, verbose_name='Data utworzenia')
+    search_vector = SearchVectorField(verbose_name='Wektor wyszukiwania', null=True, editable=False)
+
+    objects = CommentQuerySet.as_manager()
 
     def __str__(self):
         return 'Komentarz {} o {}'.format(self.author, self.post)
@@ -65,12 +246,102 @@ class Comment(models.Model):
         verbose_name_plural = 'Komentarze'
 
 
-class Message(models.Model):
+class VoteQuerySet(models.QuerySet):
+
+    def cast(self, user, target, value):
+        """
+        Ustawia głos `user` na `target` (1, -1, albo 0 aby go wycofać) i koryguje `rate` celu o różnicę
+        jednym UPDATE z F(). Głos użytkownika jest blokowany (SELECT ... FOR UPDATE), więc równoległe
+        zmiany tego samego głosu się nie gubią. Zwraca zmianę oceny.
+        """
+        lookup = {'user': user, self.model.target_field: target}
+        with transaction.atomic():
+            vote = self.select_for_update().filter(**lookup).first()
+            if vote is None:
+                if not value:
+                    return 0
+                try:
+                    with transaction.atomic():
+                        self.create(value=value, **lookup)
+                except IntegrityError:
+                    return self.cast(user, target, value)
+                delta = value
+            else:
+                delta = value - vote.value
+                if not value:
+                    vote.delete()
+                elif delta:
+                    self.filter(pk=vote.pk).update(value=value)
+            if delta:
+                type(target).objects.filter(pk=target.pk).update(rate=F('rate') + delta)
+        return delta
+
+    def recount(self):
+        """Przelicza `rate` wszystkich obiektów z sumy głosów jednym UPDATE, zwraca liczbę poprawionych."""
+        target = self.model._meta.get_field(self.model.target_field)
+        sql = """
+            UPDATE {table} AS t SET rate = COALESCE(votes.total, 0)
+            FROM {table} AS t2
+            LEFT JOIN (SELECT {column}, SUM(value) AS total FROM {vote} GROUP BY {column}) AS votes
+                   ON votes.{column} = t2.id
+            WHERE t.id = t2.id AND t.rate <> COALESCE(votes.total, 0)
+        """.format(table=target.related_model._meta.db_table, vote=self.model._meta.db_table, column=target.column)
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+            return cursor.rowcount
+
+
+class Vote(models.Model):
+    UP = 1
+    DOWN = -1
+    VALUES = (
+        (UP, 'Za'),
+        (DOWN, 'Przeciw'),
+    )
+    user = models.ForeignKey(UserProfile, verbose_name='Głosujący', related_name='+')
+    value = models.SmallIntegerField(verbose_name='Głos', choices=VALUES)
+    create_date = models.DateTimeField(auto_now_add=True, verbose_name='Data utworzenia')
+
+    objects = VoteQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+
+class PostVote(Vote):
+    target_field = 'post'
+    post = models.ForeignKey(Post, verbose_name='Post', related_name='votes')
+
+    def __str__(self):
+        return 'Głos {} na {}'.format(self.user_id, self.post_id)
+
+    class Meta:
+        verbose_name = 'Głos na post'
+        verbose_name_plural = 'Głosy na posty'
+        unique_together = (('user', 'post'), )
+
+
+class CommentVote(Vote):
+    target_field = 'comment'
+    comment = models.ForeignKey(Comment, verbose_name='Komentarz', related_name='votes')
+
+    def __str__(self):
+        return 'Głos {} na komentarz {}'.format(self.user_id, self.comment_id)
+
+    class Meta:
+        verbose_name = 'Głos na komentarz'
+        verbose_name_plural = 'Głosy na komentarze'
+        unique_together = (('user', 'comment'), )
+
+
+class Message(DirtyFieldsMixin, models.Model):
     sender = models.ForeignKey(UserProfile, verbose_name='Nadawca', related_name='sender')
     reciver = models.ForeignKey(UserProfile, verbose_name='Odbiorca', related_name='reciver')
     title = models.CharField(verbose_name='Tytuł', max_length=64)
     text = models.TextField(verbose_name='Tekst', max_length=1024)
     is_read = models.BooleanField(verbose_name='Czy odczytane', default=False)
+    low_participant = models.IntegerField(verbose_name='Uczestnik o niższym id', editable=False)
+    high_participant = models.IntegerField(verbose_name='Uczestnik o wyższym id', editable=False)
     create_date = models.DateTimeField(auto_now_add=True, verbose_name='Data utworzenia')
 
     def __str__(self):
@@ -79,10 +350,67 @@ class Message(models.Model):
     class Meta:
         verbose_name = 'Wiadomość'
         verbose_name_plural = 'Wiadomości'
-        ordering = ['-create_date']
+        ordering = ['-create_date', '-id']
+        index_together = (
+            ('reciver', 'create_date', 'id'),
+            ('low_participant', 'high_participant', 'create_date', 'id'),
+        )
+
+
+class ConversationQuerySet(models.QuerySet):
+
+    def record_message(self, message):
+        """Aktualizuje (albo zakłada) podsumowania rozmowy obu uczestników jednym INSERT ... ON CONFLICT."""
+        sql = """
+            INSERT INTO {table} AS c (owner_id, partner_id, last_message_id, last_message_date, unread_count)
+            VALUES (%(sender)s, %(reciver)s, %(message)s, %(date)s, 0),
+                   (%(reciver)s, %(sender)s, %(message)s, %(date)s, 1)
+            ON CONFLICT (owner_id, partner_id) DO UPDATE SET
+                last_message_id = CASE WHEN c.last_message_date <= EXCLUDED.last_message_date
+                                       THEN EXCLUDED.last_message_id ELSE c.last_message_id END,
+                last_message_date = GREATEST(c.last_message_date, EXCLUDED.last_message_date),
+                unread_count = c.unread_count + EXCLUDED.unread_count
+        """.format(table=self.model._meta.db_table)
+        params = {'sender': message.sender_id, 'reciver': message.reciver_id, 'message': message.pk,
+                  'date': message.create_date}
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+    def refresh_unread(self, owner_id, partner_id=None):
+        """Przelicza liczby nieprzeczytanych w rozmowach `owner_id` (tylko z `partner_id`, jeśli podano)."""
+        sql = """
+            UPDATE {table} AS c SET unread_count = (
+                SELECT COUNT(*) FROM {message}
+                WHERE reciver_id = c.owner_id AND sender_id = c.partner_id AND NOT is_read
+            )
+            WHERE owner_id = %(owner)s AND (%(partner)s IS NULL OR partner_id = %(partner)s)
+        """.format(table=self.model._meta.db_table, message=Message._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {'owner': owner_id, 'partner': partner_id})
+
+
+class Conversation(models.Model):
+    owner = models.ForeignKey(UserProfile, verbose_name='Właściciel', related_name='conversations')
+    partner = models.ForeignKey(UserProfile, verbose_name='Rozmówca', related_name='+')
+    last_message = models.ForeignKey(Message, verbose_name='Ostatnia wiadomość', related_name='+', null=True,
+                                     on_delete=models.SET_NULL)
+    last_message_date = models.DateTimeField(verbose_name='Data ostatniej wiadomości')
+    unread_count = models.PositiveIntegerField(verbose_name='Liczba nieprzeczytanych', default=0)
+
+    objects = ConversationQuerySet.as_manager()
 
+    def __str__(self):
+        return 'Rozmowa {} z {}'.format(self.owner, self.partner)
+
+    class Meta:
+        verbose_name = 'Rozmowa'
+        verbose_name_plural = 'Rozmowy'
+        ordering = ['-last_message_date']
+        unique_together = (('owner', 'partner'), )
+        index_together = (('owner', 'last_message_date'), )
 
-class Notification(models.Model):
+
+class Notification(DirtyFieldsMixin, models.Model):
     MESSAGE = 'MESSAGE'
     COMMENT = 'COMMENT'
     REMOVE = 'REMOVE'
@@ -105,7 +433,8 @@ class Notification(models.Model):
     class Meta:
         verbose_name = 'Powiadomienie'
         verbose_name_plural = 'Powiadomienia'
-        ordering = ['-create_date']
+        ordering = ['-create_date', '-id']
+        index_together = (('user', 'create_date', 'id'), )
 
 
 class ReportedPost(models.Model):
@@ -136,3 +465,65 @@ class ReportedComment(models.Model):
     class Meta:
         verbose_name = 'zgłoszenie komentarza'
         verbose_name_plural = 'Zgłoszone komentarze'
+
+
+class TagCount(models.Model):
+    tag = models.CharField(verbose_name='Tag', max_length=20, primary_key=True)
+    count = models.PositiveIntegerField(verbose_name='Liczba postów', default=0, db_index=True)
+
+    def __str__(self):
+        return self.tag
+
+    class Meta:
+        verbose_name = 'Popularność tagu'
+        verbose_name_plural = 'Popularność tagów'
+        ordering = ['-count', 'tag']
+
+
+class ThrottleCounterQuerySet(models.QuerySet):
+
+    def hit(self, key, period, duration, weight, limit):
+        """
+        Zlicza żądanie w oknie `period` jednym INSERT ... ON CONFLICT, o ile `poprzednie * weight + bieżące + 1`
+        nie przekracza `limit`, i zwraca liczniki (poprzednie okno, bieżące okno). Odrzucone żądanie nie zmienia
+        wiersza (warunek WHERE w DO UPDATE) i zwraca None. Wiersz klucza jest przesuwany na nowe okno w miejscu.
+        """
+        previous = 'CASE WHEN t.period = EXCLUDED.period THEN t.previous ' \
+                   'WHEN t.period = EXCLUDED.period - 1 THEN t.current ELSE 0 END'
+        current = 'CASE WHEN t.period = EXCLUDED.period THEN t.current ELSE 0 END'
+        sql = """
+            INSERT INTO {table} AS t (key, period, current, previous, expires)
+            VALUES (%(key)s, %(period)s, 1, 0, %(expires)s)
+            ON CONFLICT (key) DO UPDATE SET
+                previous = {previous},
+                current = {current} + 1,
+                period = EXCLUDED.period,
+                expires = EXCLUDED.expires
+            WHERE ({previous}) * %(weight)s + ({current}) + 1 <= %(limit)s
+            RETURNING previous, current
+        """.format(table=self.model._meta.db_table, previous=previous, current=current)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {'key': key, 'period': period, 'expires': (period + 2) * duration,
+                                 'weight': weight, 'limit': limit})
+            return cursor.fetchone()
+
+    def expired(self, now):
+        """Liczniki, których oba okna już minęły, więc nie wpływają na żaden limit."""
+        return self.filter(expires__lte=now)
+
+
+class ThrottleCounter(models.Model):
+    key = models.CharField(verbose_name='Klucz', max_length=255, primary_key=True)
+    period = models.BigIntegerField(verbose_name='Numer okna')
+    current = models.PositiveIntegerField(verbose_name='Żądania w bieżącym oknie', default=0)
+    previous = models.PositiveIntegerField(verbose_name='Żądania w poprzednim oknie', default=0)
+    expires = models.BigIntegerField(verbose_name='Wygasa (timestamp)', db_index=True, default=0)
+
+    objects = ThrottleCounterQuerySet.as_manager()
+
+    def __str__(self):
+        return self.key
+
+    class Meta:
+        verbose_name = 'Licznik limitu żądań'
+        verbose_name_plural = 'Liczniki limitów żądań'
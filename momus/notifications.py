@@ -0,0 +1,123 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from momus.caches import unread_counter
+from momus.models import Notification
+from momus.pubsub import event_broker
+
+
+logger = logging.getLogger(__name__)
+
+class NotificationQueue(object):
+    """
+    Bufor powiadomień zapisywanych hurtowo przez bulk_create.
+
+    Powiadomienia trafiają do bufora dopiero po zatwierdzeniu transakcji (transaction.on_commit),
+    a bufor jest opróżniany po osiągnięciu `max_size` elementów albo po `max_delay` sekundach;
+    zdarzenia są publikowane jednym wywołaniem brokera dopiero po zapisaniu paczki w bazie.
+    Nieudany zapis jest logowany, a paczka wraca do bufora i czeka na kolejną próbę.
+
+    Bufor żyje w pamięci procesu, więc powiadomienia z ostatnich `max_delay` sekund giną razem
+    z zabitym workerem. Trwałość daje `spool_dir`: paczki są odkładane do plików, które zapisuje
+    do bazy osobny proces (`manage.py drain_notifications`) i on też publikuje ich zdarzenia.
+    """
+
+    def __init__(self, max_size=100, max_delay=2.0, spool_dir=None):
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.spool_dir = spool_dir
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def put(self, user_id, type, data=None):
+        notification = Notification(user_id=user_id, type=type, data=data)
+        transaction.on_commit(lambda: self._append(notification))
+
+    def flush(self):
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if not batch:
+            return 0
+        try:
+            if self.spool_dir:
+                self._spool(batch)
+                return len(batch)
+            Notification.objects.bulk_create(batch)
+        except Exception:
+            logger.exception('Nie udało się zapisać %d powiadomień, paczka wraca do bufora.', len(batch))
+            with self._lock:
+                self._buffer[:0] = batch
+                self._schedule_flush()
+            return 0
+        self._published(batch)
+        return len(batch)
+
+    def drain(self):
+        """Zapisuje do bazy wszystkie paczki z katalogu `spool_dir`, zwraca liczbę powiadomień."""
+        drained = 0
+        for name in sorted(os.listdir(self.spool_dir)):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.spool_dir, name)
+            with open(path) as spool_file:
+                batch = [Notification(**row) for row in json.load(spool_file)]
+            with transaction.atomic():
+                Notification.objects.bulk_create(batch)
+                os.remove(path)
+            self._published(batch)
+            drained += len(batch)
+        return drained
+
+    def _append(self, notification):
+        with self._lock:
+            self._buffer.append(notification)
+            is_full = len(self._buffer) >= self.max_size or not self.max_delay
+            if not is_full:
+                self._schedule_flush()
+        if is_full:
+            self.flush()
+
+    def _schedule_flush(self):
+        """Uruchamia timer opróżniający bufor; wywoływane pod `_lock`."""
+        if self._timer is None and self.max_delay:
+            self._timer = threading.Timer(self.max_delay, self._flush_from_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    @staticmethod
+    def _published(batch):
+        """Po zapisie paczki: unieważnia liczniki nieprzeczytanych i rozsyła zdarzenia."""
+        unread_counter.invalidate(*{notification.user_id for notification in batch})
+        event_broker.publish_many([(notification.user_id, {'type': notification.type, 'data': notification.data})
+                                   for notification in batch])
+
+    def _flush_from_timer(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        finally:
+            connection.close()
+
+    def _spool(self, batch):
+        rows = [{'user_id': notification.user_id, 'type': notification.type, 'data': notification.data}
+                for notification in batch]
+        name = '{:.6f}-{}'.format(time.time(), uuid4().hex)
+        tmp_path = os.path.join(self.spool_dir, name + '.tmp')
+        with open(tmp_path, 'w') as spool_file:
+            json.dump(rows, spool_file)
+        os.rename(tmp_path, os.path.join(self.spool_dir, name + '.json'))
+
+
+notification_queue = NotificationQueue(**{key.lower(): value for key, value in
+                                          getattr(settings, 'NOTIFICATION_QUEUE', {}).items()})
+atexit.register(notification_queue.flush)
@@ -1,4 +1,15 @@
-from rest_framework.pagination import PageNumberPagination
+from base64 import b64decode, b64encode
+from collections import namedtuple
+from datetime import datetime
+from functools import reduce
+from urllib import parse
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination, CursorPagination
+from rest_framework.utils.urls import replace_query_param
 
 
 class LargeResultsSetPagination(PageNumberPagination):
@@ -11,3 +22,126 @@ class StandardResultsSetPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 25
+
+
+Position = namedtuple('Position', ['reverse', 'value', 'pk'])
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Paginacja po kluczu (create_date, id) - bez COUNT(*) i bez OFFSET.
+
+    Kursor zawiera wartość klucza (datę albo liczbę) i id ostatniego elementu strony, więc każda strona
+    to jedno zapytanie po indeksie (klucz, id), niezależnie od tego jak daleko jest od początku listy.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 25
+    ordering = ('-create_date', '-id')
+    invalid_cursor_message = 'Niepoprawny kursor.'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+
+        if reverse:
+            queryset = queryset.order_by(*[self._flip(order) for order in self.ordering])
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if self.cursor is not None:
+            queryset = queryset.filter(self._after(self.cursor))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if self.page:
+            value, pk = self._get_position(self.page[-1])
+        else:
+            value, pk = self.cursor.value, self.cursor.pk
+        return self.encode_cursor(Position(reverse=False, value=value, pk=pk))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.page:
+            value, pk = self._get_position(self.page[0])
+        else:
+            value, pk = self.cursor.value, self.cursor.pk
+        return self.encode_cursor(Position(reverse=True, value=value, pk=pk))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            tokens = parse.parse_qs(b64decode(encoded.encode('ascii')).decode('ascii'))
+            if 'v' in tokens:
+                value = float(tokens['v'][0])
+            else:
+                value = parse_datetime(tokens['d'][0])
+            pk = int(tokens['k'][0])
+            reverse = tokens.get('r', ['0'])[0] == '1'
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if value is None:
+            raise NotFound(self.invalid_cursor_message)
+        return Position(reverse=reverse, value=value, pk=pk)
+
+    def encode_cursor(self, position):
+        if isinstance(position.value, datetime):
+            tokens = {'d': position.value.isoformat(), 'k': str(position.pk)}
+        else:
+            tokens = {'v': repr(float(position.value)), 'k': str(position.pk)}
+        if position.reverse:
+            tokens['r'] = '1'
+        encoded = b64encode(parse.urlencode(tokens).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def _after(self, cursor):
+        """Warunek na elementy leżące za kursorem, z redundantnym `<=` ograniczającym zakres indeksu."""
+        key_field, pk_field = [order.lstrip('-') for order in self.ordering]
+        lookup = 'lt' if self.ordering[0].startswith('-') != cursor.reverse else 'gt'
+        before_or_equal = Q(**{'{}__{}e'.format(key_field, lookup): cursor.value})
+        strictly_before = Q(**{'{}__{}'.format(key_field, lookup): cursor.value}) |\
+            Q(**{'{}__{}'.format(pk_field, lookup): cursor.pk})
+        return before_or_equal & strictly_before
+
+    def _get_position(self, instance):
+        key_field, pk_field = [order.lstrip('-') for order in self.ordering]
+        if isinstance(instance, dict):
+            return instance[key_field], instance[pk_field]
+        return reduce(getattr, key_field.split('__'), instance), getattr(instance, pk_field)
+
+    @staticmethod
+    def _flip(order):
+        return order[1:] if order.startswith('-') else '-' + order
+
+
+class MessageHistoryPagination(KeysetPagination):
+    page_size = 25
+    max_page_size = 100
@@ -5,7 +5,7 @@ from rest_framework.compat import is_authenticated
 class IsOwnerOrReadOnlyForPost(BasePermission):
 
     def has_object_permission(self, request, view, obj):
-        return request.method in SAFE_METHODS or obj.author.user == request.user
+        return request.method in SAFE_METHODS or obj.author.user_id == request.user.pk
 
     def has_permission(self, request, view):
         return request.method in SAFE_METHODS or request.user and is_authenticated(request.user)
@@ -14,7 +14,7 @@ class IsOwnerOrReadOnlyForPost(BasePermission):
 class IsOwnerOrReadOnlyForUserProfile(BasePermission):
 
     def has_object_permission(self, request, view, obj):
-        return request.method in SAFE_METHODS or obj.user == request.user
+        return request.method in SAFE_METHODS or obj.user_id == request.user.pk
 
     def has_permission(self, request, view):
         return request.method in SAFE_METHODS or request.user and is_authenticated(request.user)
@@ -23,7 +23,7 @@ class IsOwnerOrReadOnlyForUserProfile(BasePermission):
 class IsOwnerForFavorite(BasePermission):
 
     def has_object_permission(self, request, view, obj):
-        return obj.user == request.user.userprofile
+        return obj.user_id == request.user.userprofile.pk
 
     def has_permission(self, request, view):
         return request.user and is_authenticated(request.user)
@@ -32,7 +32,7 @@ class IsOwnerForFavorite(BasePermission):
 class IsOwnerOrReadOnlyForComment(BasePermission):
 
     def has_object_permission(self, request, view, obj):
-        return request.method in SAFE_METHODS or obj.author == request.user.userprofile
+        return request.method in SAFE_METHODS or obj.author_id == request.user.userprofile.pk
 
     def has_permission(self, request, view):
         return request.method in SAFE_METHODS or request.user and is_authenticated(request.user)
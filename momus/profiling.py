@@ -0,0 +1,157 @@
+import cProfile
+import json
+import os
+import random
+import re
+import time
+import uuid
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from rest_framework.exceptions import AuthenticationFailed
+
+from momus.authentication import CachedTokenAuthentication
+
+
+PROFILE_ID = re.compile(r'^\d{20}-[0-9a-f]{8}$')
+SQL_LITERAL = re.compile(r"(?:\b[EeBbXx])?'(?:[^']|'')*'|\b\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+
+
+def redact_sql(sql):
+    """Zastępuje literały w SQL znakiem `?`, żeby w profilach nie zostały tokeny, klucze sesji ani hasła."""
+    return SQL_LITERAL.sub('?', sql)
+
+
+class ProfileStore(object):
+    """
+    Profile żądań na dysku: `<id>.prof` (pstats, np. dla snakeviz) i `<id>.json` z opisem żądania i jego SQL
+    (bez literałów).
+
+    Identyfikatory zaczynają się od daty, więc po przekroczeniu `max_profiles` usuwane są najstarsze.
+    """
+
+    def __init__(self, directory, max_profiles=200):
+        self.directory = directory
+        self.max_profiles = max_profiles
+
+    def save(self, profiler, **info):
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = '{:%Y%m%d%H%M%S%f}-{}'.format(timezone.now(), uuid.uuid4().hex[:8])
+        profiler.dump_stats(self.path(profile_id, 'prof'))
+        with open(self.path(profile_id, 'json'), 'w') as info_file:
+            json.dump(dict(info, id=profile_id), info_file)
+        self.prune()
+        return profile_id
+
+    def list(self):
+        """Opisy zapisanych profili, od najwolniejszego żądania."""
+        profiles = []
+        for profile_id in self.ids():
+            try:
+                with open(self.path(profile_id, 'json')) as info_file:
+                    profiles.append(json.load(info_file))
+            except (OSError, ValueError):
+                continue
+        return sorted(profiles, key=lambda info: info['duration_ms'], reverse=True)
+
+    def path(self, profile_id, extension):
+        if not PROFILE_ID.match(profile_id):
+            raise ValueError('Niepoprawny identyfikator profilu: {}'.format(profile_id))
+        return os.path.join(self.directory, '{}.{}'.format(profile_id, extension))
+
+    def ids(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-5] for name in os.listdir(self.directory)
+                      if name.endswith('.json') and PROFILE_ID.match(name[:-5]))
+
+    def prune(self):
+        ids = self.ids()
+        for profile_id in ids[:max(len(ids) - self.max_profiles, 0)]:
+            for extension in ('json', 'prof'):
+                try:
+                    os.remove(self.path(profile_id, extension))
+                except FileNotFoundError:
+                    pass
+
+
+def create_store():
+    config = settings.PROFILING
+    return ProfileStore(config['DIRECTORY'], config.get('MAX_PROFILES', 200))
+
+
+def view_route(view_func, method):
+    """Nazwa trasy w tej samej postaci co w metrykach (`Widok.akcja`), ustalana przed wywołaniem widoku."""
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return '{}.{}'.format(view_func.__name__, method.lower())
+    actions = getattr(view_func, 'actions', None) or {}
+    return '{}.{}'.format(view_class.__name__, actions.get(method.lower(), method.lower()))
+
+
+class ProfilingMiddleware(object):
+    """
+    Profiluje cProfile losową część żądań do tras z PROFILING['ROUTES'] (np. `{'MessageViewSet.list': 0.05}`)
+    oraz każde żądanie administratora z nagłówkiem PROFILING['HEADER']. Profil razem z wykonanym SQL trafia
+    do ProfileStore, a jego identyfikator do nagłówka X-Profile-Id.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = getattr(settings, 'PROFILING', {})
+        if not config.get('ENABLED', False):
+            return self.get_response(request)
+        force_debug_cursor = connection.force_debug_cursor
+        try:
+            response = self.get_response(request)
+        finally:
+            profiling = getattr(request, 'profiling', None)
+            if profiling:
+                profiling['profiler'].disable()
+            connection.force_debug_cursor = force_debug_cursor
+        if profiling:
+            response['X-Profile-Id'] = self.save(request, response, **profiling)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """Decyzja o profilowaniu zapada dopiero tu, gdy znany jest widok; profil obejmuje widok i renderowanie."""
+        config = getattr(settings, 'PROFILING', {})
+        if not config.get('ENABLED', False):
+            return None
+        route = view_route(view_func, request.method)
+        if not (self.requested_by_admin(request, config) or
+                random.random() < config.get('ROUTES', {}).get(route, config.get('SAMPLE_RATE', 0.0))):
+            return None
+        connection.force_debug_cursor = True
+        profiler = cProfile.Profile()
+        request.profiling = {'route': route, 'profiler': profiler, 'first_query': len(connection.queries_log),
+                             'started': time.perf_counter()}
+        profiler.enable()
+        return None
+
+    @staticmethod
+    def requested_by_admin(request, config):
+        if 'HTTP_' + config.get('HEADER', 'X-Profile').upper().replace('-', '_') not in request.META:
+            return False
+        if request.user.is_staff:
+            return True
+        try:
+            authenticated = CachedTokenAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return False
+        return authenticated is not None and authenticated[0].is_staff
+
+    @staticmethod
+    def save(request, response, route, profiler, first_query, started):
+        duration = time.perf_counter() - started
+        queries = [{'sql': redact_sql(query['sql']), 'time': float(query['time'])}
+                   for query in islice(connection.queries_log, first_query, None)]
+        return create_store().save(
+            profiler, route=route, method=request.method, path=request.get_full_path(),
+            status=response.status_code, duration_ms=round(duration * 1000, 3), queries=queries,
+            db_ms=round(sum(query['time'] for query in queries) * 1000, 3), create_date=timezone.now().isoformat())
@@ -0,0 +1,136 @@
+import json
+import logging
+import queue
+import select
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription(object):
+
+    def __init__(self, broker, user_id, max_size=100):
+        self.broker = broker
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize=max_size)
+
+    def get(self, timeout=None):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def get_nowait(self):
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker(object):
+    """
+    Pub/sub zdarzeń użytkowników w obrębie jednego procesu.
+
+    `publish` należy wywoływać po zatwierdzeniu transakcji; oczekujący klienci czekają na kolejce
+    bez odpytywania bazy.
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        subscription = Subscription(self, user_id)
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self._subscribers.pop(subscription.user_id, None)
+
+    def publish(self, user_id, event):
+        self.publish_many([(user_id, event)])
+
+    def publish_many(self, events):
+        """Publikuje paczkę par (user_id, zdarzenie)."""
+        for user_id, event in events:
+            self.dispatch(user_id, event)
+
+    def dispatch(self, user_id, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(event)
+            except queue.Full:
+                logger.warning('Kolejka zdarzeń użytkownika %s jest pełna, zdarzenie pominięto.', user_id)
+
+
+class PostgresBroker(LocalBroker):
+    """
+    Pub/sub przez LISTEN/NOTIFY PostgreSQL, dzięki któremu zdarzenie trafia do klientów wszystkich procesów.
+
+    Każdy proces ma jeden wątek nasłuchujący, uruchamiany przy pierwszej subskrypcji, który
+    rozsyła odebrane powiadomienia do lokalnych subskrybentów.
+    """
+    channel = 'momus_events'
+
+    def __init__(self):
+        super(PostgresBroker, self).__init__()
+        self._listener = None
+
+    def subscribe(self, user_id):
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name='momus-events-listener', daemon=True)
+                self._listener.start()
+        return super(PostgresBroker, self).subscribe(user_id)
+
+    def publish_many(self, events):
+        """Cała paczka jednym zapytaniem; osobne NOTIFY na zdarzenie, bo treść jednego jest ograniczona do 8000 B."""
+        payloads = [json.dumps({'user': user_id, 'event': event}) for user_id, event in events]
+        if not payloads:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload', [self.channel, payloads])
+
+    def _listen(self):
+        while True:
+            try:
+                connection.ensure_connection()
+                raw_connection = connection.connection
+                with raw_connection.cursor() as cursor:
+                    cursor.execute('LISTEN {}'.format(self.channel))
+                while True:
+                    if select.select([raw_connection], [], [], 30) == ([], [], []):
+                        continue
+                    raw_connection.poll()
+                    while raw_connection.notifies:
+                        message = json.loads(raw_connection.notifies.pop(0).payload)
+                        self.dispatch(message['user'], message['event'])
+            except Exception:
+                logger.exception('Nasłuchiwanie zdarzeń przerwane, ponowne połączenie za 5 s.')
+                connection.close()
+                time.sleep(5)
+
+
+def create_broker():
+    if getattr(settings, 'EVENT_BROKER', 'local') == 'postgres' and connection.vendor == 'postgresql':
+        return PostgresBroker()
+    return LocalBroker()
+
+
+event_broker = create_broker()
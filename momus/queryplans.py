@@ -0,0 +1,59 @@
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+
+from rest_framework import serializers
+
+
+@lru_cache(maxsize=None)
+def get_query_plan(serializer_class):
+    """
+    Wyznacza (select_related, prefetch_related) potrzebne do serializacji bez dodatkowych zapytań.
+
+    Plan wynika z drzewa pól serializera: zagnieżdżone serializery i pola relacyjne czytające coś więcej
+    niż klucz główny są dołączane przez select_related (relacje do jednego) albo prefetch_related
+    (relacje do wielu oraz wszystko, co leży pod nimi).
+    """
+    select_related, prefetch_related = [], []
+    _collect(serializer_class(), '', select_related, prefetch_related)
+    return tuple(select_related), tuple(prefetch_related)
+
+
+def _collect(serializer, prefix, select_related, prefetch_related, prefetching=False):
+    model = serializer.Meta.model
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+        try:
+            model_field = model._meta.get_field(field.source_attrs[0])
+        except FieldDoesNotExist:
+            continue
+        if not model_field.is_relation or isinstance(field, serializers.PrimaryKeyRelatedField):
+            continue
+
+        path = prefix + field.source_attrs[0]
+        to_many = model_field.many_to_many or model_field.one_to_many
+        nested = field.child if isinstance(field, serializers.ListSerializer) else field
+        (prefetch_related if to_many or prefetching else select_related).append(path)
+        if isinstance(nested, serializers.ModelSerializer):
+            _collect(nested, path + '__', select_related, prefetch_related, prefetching or to_many)
+
+
+class QueryPlanMixin(object):
+    """
+    Dokłada do querysetu widoku plan pobierania wynikający z jego serializera.
+
+    Relacje, których nie da się wyczytać z pól (np. użycie `__str__` modelu powiązanego),
+    widok dopisuje w `select_related_extra`.
+    """
+    select_related_extra = ()
+
+    def filter_queryset(self, queryset):
+        queryset = super(QueryPlanMixin, self).filter_queryset(queryset)
+        select_related, prefetch_related = get_query_plan(self.get_serializer_class())
+        select_related += tuple(self.select_related_extra)
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
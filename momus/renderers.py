@@ -0,0 +1,13 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class EventStreamRenderer(BaseRenderer):
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """Strumień zwraca StreamingHttpResponse, więc tu trafiają tylko błędy (401, 429...) - jako JSON"""
+        if isinstance(data, (dict, list)):
+            return JSONRenderer().render(data, renderer_context=renderer_context)
+        return data
@@ -0,0 +1,121 @@
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db import models
+
+from rest_framework import serializers
+from rest_framework.response import Response
+
+
+PLAIN_FIELDS = (
+    (serializers.CharField, (models.CharField, models.TextField)),
+    (serializers.IntegerField, (models.IntegerField, )),
+    (serializers.BooleanField, (models.BooleanField, )),
+)
+
+
+class RowSerializer(object):
+    """
+    Szybka, tylko do odczytu, wersja ModelSerializera działająca na wierszach z `.values()`.
+
+    Drzewo pól serializera jest raz kompilowane do listy kolumn i funkcji budujących słownik,
+    dzięki czemu lista nie tworzy instancji modeli ani serializerów dla każdego elementu.
+    Wynik jest taki sam jak `serializer_class(many=True).data`. Pola z własną logiką mogą udostępnić
+    metodę `row_getter(column)` zwracającą funkcję `getter(row, request)`.
+    """
+
+    def __init__(self, serializer_class):
+        self.columns = []
+        self._build = self._compile(serializer_class(), '')
+
+    def to_representation(self, rows, request=None):
+        build = self._build
+        return [build(row, request) for row in rows]
+
+    def _compile(self, serializer, prefix):
+        model = serializer.Meta.model
+        getters = []
+        for field in serializer.fields.values():
+            if field.write_only:
+                continue
+            if field.source == '*' or len(field.source_attrs) != 1:
+                raise ImproperlyConfigured('Źródło pola {} nie jest obsługiwane.'.format(field.field_name))
+            try:
+                model_field = model._meta.get_field(field.source)
+            except FieldDoesNotExist:
+                raise ImproperlyConfigured('Pole {} nie jest polem modelu.'.format(field.field_name))
+
+            column = prefix + model_field.name
+            if isinstance(field, serializers.ModelSerializer) and (model_field.many_to_one or model_field.one_to_one):
+                getters.append((field.field_name, self._nested(self._compile(field, column + '__'), column)))
+                continue
+            if model_field.is_relation:
+                raise ImproperlyConfigured('Relacja {} nie jest obsługiwana przez RowSerializer.'.format(column))
+
+            if hasattr(field, 'row_getter'):
+                getters.append((field.field_name, field.row_getter(column)))
+            elif isinstance(field, serializers.FileField):
+                getters.append((field.field_name, self._file(column, model_field.storage)))
+            elif any(isinstance(field, field_class) and isinstance(model_field, model_classes)
+                     for field_class, model_classes in PLAIN_FIELDS):
+                getters.append((field.field_name, self._plain(column)))
+            else:
+                getters.append((field.field_name, self._converted(column, field.to_representation)))
+            self.columns.append(column)
+
+        def build(row, request):
+            return OrderedDict([(name, getter(row, request)) for name, getter in getters])
+        return build
+
+    def _nested(self, build, column):
+        self.columns.append(column)
+
+        def getter(row, request):
+            return None if row[column] is None else build(row, request)
+        return getter
+
+    @staticmethod
+    def _plain(column):
+        def getter(row, request):
+            return row[column]
+        return getter
+
+    @staticmethod
+    def _converted(column, to_representation):
+        def getter(row, request):
+            value = row[column]
+            return None if value is None else to_representation(value)
+        return getter
+
+    @staticmethod
+    def _file(column, storage):
+        def getter(row, request):
+            name = row[column]
+            if not name:
+                return None
+            url = storage.url(name)
+            return request.build_absolute_uri(url) if request is not None else url
+        return getter
+
+
+@lru_cache(maxsize=None)
+def get_row_serializer(serializer_class):
+    return RowSerializer(serializer_class)
+
+
+class RowSerializerListMixin(object):
+    """Akcja `list` oparta o RowSerializer zamiast pełnego serializera widoku."""
+
+    def list(self, request, *args, **kwargs):
+        row_serializer = get_row_serializer(self.get_serializer_class())
+        columns = list(row_serializer.columns)
+        for order in getattr(self.paginator, 'ordering', ()):
+            if order.lstrip('-') not in columns:
+                columns.append(order.lstrip('-'))
+        queryset = self.filter_queryset(self.get_queryset()).values(*columns)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(row_serializer.to_representation(page, request))
+        return Response(row_serializer.to_representation(queryset, request))
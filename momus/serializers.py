@@ -1,23 +1,97 @@
+import binascii
+import os
+import re
 from base64 import b64decode
+from collections import defaultdict, OrderedDict
+from tempfile import SpooledTemporaryFile
 from uuid import uuid4
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
 from django.contrib.auth.models import User
 from django.utils.text import slugify
 
 from rest_framework import serializers
 
-from momus.models import UserProfile, Post, Favorite, Comment, Message, ReportedPost, ReportedComment, Notification
+from PIL import Image
+
+from momus.models import UserProfile, Post, Favorite, Comment, Message, ReportedPost, ReportedComment, Notification,\
+                         TagCount, Conversation, Vote
+from momus.images import image_pipeline, IMAGE_EXTENSIONS
+from momus.caches import unread_counter
+
+
+NOT_BASE64 = re.compile('[^A-Za-z0-9+/=]')
 
 
 class ImageBase64Field(serializers.ImageField):
+    """
+    Obrazek przesłany jako data URI w base64.
+
+    Dane są dekodowane porcjami do pliku tymczasowego, a Pillow ustala prawdziwy format i sprawdza
+    spójność pliku (`verify`, bez dekodowania pikseli); przetwarzanie obrazka odbywa się później w `momus.images`.
+    """
+    chunk_size = 64 * 1024
+
     def to_internal_value(self, data):
         try:
-            decoded_image = b64decode(data.split(',')[1])
-        except TypeError:
+            encoded = data.split(',', 1)[1]
+        except (AttributeError, IndexError):
             raise serializers.ValidationError('Niepoprawny format zdjęcia.')
-        data = ContentFile(decoded_image, name=str(uuid4()) + '.png')
-        return super(ImageBase64Field, self).to_internal_value(data)
+
+        decoded = SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        pending = ''
+        try:
+            for start in range(0, len(encoded), self.chunk_size):
+                # Znaki spoza alfabetu (np. łamanie linii MIME) są pomijane jak w b64decode, a dekodowane są
+                # tylko pełne czwórki znaków, żeby granice porcji nie rozjechały się z blokami base64.
+                pending += NOT_BASE64.sub('', encoded[start:start + self.chunk_size])
+                usable = len(pending) - len(pending) % 4
+                decoded.write(b64decode(pending[:usable]))
+                pending = pending[usable:]
+            if pending:
+                raise binascii.Error('Incorrect padding')
+        except (binascii.Error, ValueError):
+            raise serializers.ValidationError('Niepoprawny format zdjęcia.')
+
+        # Ogólne sprawdzenia pola pliku (pusty plik, max_length, allow_empty_file) bez ponownego
+        # dekodowania obrazka przez ImageField; nazwa ma już docelową długość, rozszerzenie dochodzi niżej.
+        image_file = serializers.FileField.to_internal_value(self, File(decoded, name='{}.jpeg'.format(uuid4())))
+        decoded.seek(0)
+        try:
+            image = Image.open(decoded)
+            image_format = image.format
+            image.verify()
+        except Exception:
+            self.fail('invalid_image')
+        if image_format not in IMAGE_EXTENSIONS:
+            self.fail('invalid_image')
+        decoded.seek(0)
+        image_file.name = '{}.{}'.format(os.path.splitext(image_file.name)[0], IMAGE_EXTENSIONS[image_format])
+        return image_file
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Adresy wygenerowanych wariantów obrazka, np. `thumbnail` i `thumbnailWebp`."""
+
+    def to_representation(self, value):
+        return self.variant_urls(value, self.context.get('request'))
+
+    def row_getter(self, column):
+        def getter(row, request):
+            return self.variant_urls(row[column], request)
+        return getter
+
+    @staticmethod
+    def variant_urls(names, request):
+        urls = OrderedDict()
+        for name in names or ():
+            variant, extension = os.path.splitext(os.path.basename(name))
+            url = default_storage.url(name)
+            urls[variant + ('Webp' if extension == '.webp' else '')] = \
+                request.build_absolute_uri(url) if request is not None else url
+        return urls
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -34,10 +108,11 @@ class UserProfileSerializer(serializers.ModelSerializer):
     user = UserSerializer()
     birthDate = serializers.DateField(source='birth_date', allow_null=True, read_only=True)
     photo = ImageBase64Field()
+    photoVariants = ImageVariantsField(source='photo_variants')
 
     class Meta:
         model = UserProfile
-        fields = ('user', 'photo', 'city', 'description', 'birthDate')
+        fields = ('user', 'photo', 'photoVariants', 'city', 'description', 'birthDate')
 
     def update(self, instance, validated_data):
         try:
@@ -55,9 +130,14 @@ class UserProfileSerializer(serializers.ModelSerializer):
         if last_name or first_name:
             instance.user.save()
 
+        photo_changed = 'photo' in validated_data
+        if photo_changed:
+            validated_data['photo_variants'] = []
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         instance.save()
+        if photo_changed and instance.photo:
+            image_pipeline.schedule(instance, 'photo')
 
         return instance
 
@@ -65,22 +145,22 @@ class UserProfileSerializer(serializers.ModelSerializer):
 class PostSerializer(serializers.ModelSerializer):
     author = UserProfileSerializer(read_only=True)
     isPending = serializers.BooleanField(source='is_pending', read_only=True)
+    commentCount = serializers.IntegerField(source='comment_count', read_only=True)
+    favoriteCount = serializers.IntegerField(source='favorite_count', read_only=True)
     tags = serializers.ListField(child=serializers.CharField(max_length=20, allow_blank=True))
     image = ImageBase64Field()
+    imageVariants = ImageVariantsField(source='image_variants')
 
     class Meta:
         model = Post
-        fields = ('author', 'title', 'slug', 'image', 'rate', 'tags', 'isPending')
+        fields = ('author', 'title', 'slug', 'image', 'imageVariants', 'rate', 'tags', 'isPending', 'commentCount',
+                  'favoriteCount')
         read_only_fields = ('slug', 'rate')
 
     def create(self, validated_data):
-        slug = slugify(validated_data['title'])
-        number = 0
-        while Post.objects.filter(slug=slug).exists():
-            number += 1
-            slug = slugify('{}-{}'.format(validated_data['title'], str(number)))
-        validated_data['slug'] = slug
-        return super(PostSerializer, self).create(validated_data)
+        post = Post.objects.create_with_slug(slugify(validated_data['title']), **validated_data)
+        image_pipeline.schedule(post, 'image')
+        return post
 
 
 class FavoriteSerializer(serializers.ModelSerializer):
@@ -113,6 +193,45 @@ class CommentSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'rate', 'create_date')
 
 
+class CommentTreeSerializer(serializers.ModelSerializer):
+    author = UserProfileSerializer(read_only=True)
+
+    class Meta:
+        model = Comment
+        fields = ('id', 'author', 'rate', 'text', 'create_date')
+
+    @classmethod
+    def build_tree(cls, comments, max_depth=None, max_siblings=None):
+        """
+        Składa zagnieżdżone drzewo z płaskiej listy komentarzy posortowanej po dacie utworzenia.
+
+        Drzewo jest budowane w O(n), a serializowane są tylko komentarze mieszczące się w limitach
+        głębokości i liczby odpowiedzi; `repliesCount` podaje pełną liczbę odpowiedzi danego komentarza.
+        """
+        children = defaultdict(list)
+        for comment in comments:
+            children[comment.parent_id].append(comment)
+
+        selected, level, depth = [], children[None][:max_siblings], 1
+        while level:
+            selected.extend(level)
+            if max_depth is not None and depth >= max_depth:
+                break
+            level = [reply for comment in level for reply in children[comment.id][:max_siblings]]
+            depth += 1
+
+        nodes = OrderedDict()
+        for comment, data in zip(selected, cls(selected, many=True).data):
+            data['repliesCount'] = len(children[comment.id])
+            data['replies'] = []
+            nodes[comment.id] = data
+        roots = []
+        for comment in selected:
+            siblings = nodes[comment.parent_id]['replies'] if comment.parent_id in nodes else roots
+            siblings.append(nodes[comment.id])
+        return roots
+
+
 class MessageSerializer(serializers.ModelSerializer):
     sender = serializers.CharField(read_only=True)
     reciver = serializers.CharField(read_only=True)
@@ -135,11 +254,25 @@ class MessageSerializer(serializers.ModelSerializer):
         return super(MessageSerializer, self).create(validated_data)
 
     def update(self, instance, validated_data):
-        instance.is_read = True
-        instance.save()
+        if not instance.is_read:
+            instance.is_read = True
+            instance.save()
+            Conversation.objects.refresh_unread(owner_id=instance.reciver_id, partner_id=instance.sender_id)
+            unread_counter.invalidate(instance.reciver_id)
         return instance
 
 
+class ConversationSerializer(serializers.ModelSerializer):
+    user = UserProfileSerializer(source='partner', read_only=True)
+    lastMessage = MessageSerializer(source='last_message', read_only=True)
+    lastMessageDate = serializers.DateTimeField(source='last_message_date', read_only=True)
+    unreadCount = serializers.IntegerField(source='unread_count', read_only=True)
+
+    class Meta:
+        model = Conversation
+        fields = ('user', 'lastMessage', 'lastMessageDate', 'unreadCount')
+
+
 class ReportedPostSerializer(serializers.ModelSerializer):
     post = serializers.SlugRelatedField(queryset=Post.objects.all(), slug_field='slug')
 
@@ -162,5 +295,27 @@ class NotificationSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Notification
-        fields = ('title', 'text', 'type', 'data', 'create_date')
-        read_only_fields = ('title', 'text', 'type', 'data', 'create_date')
+        fields = ('id', 'type', 'data', 'is_read', 'create_date')
+        read_only_fields = ('id', 'type', 'data', 'is_read', 'create_date')
+
+
+class TagCountSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = TagCount
+        fields = ('tag', 'count')
+        read_only_fields = ('tag', 'count')
+
+
+class VoteSerializer(serializers.Serializer):
+    value = serializers.ChoiceField(choices=Vote.VALUES)
+
+
+class MarkReadSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    upTo = serializers.IntegerField(source='up_to', min_value=1, required=False)
+
+    def validate_ids(self, value):
+        if len(value) > 1000:
+            raise serializers.ValidationError('Można oznaczyć najwyżej 1000 elementów naraz.')
+        return value
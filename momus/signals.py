@@ -1,8 +1,15 @@
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save, post_delete
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, post_delete, post_migrate
 from django.dispatch import receiver
 
-from momus.models import UserProfile, Comment, Notification, Message, Post
+from rest_framework.authtoken.models import Token
+
+from momus.models import UserProfile, Comment, Notification, Message, Post, Favorite, Conversation
+from momus.notifications import notification_queue
+from momus.caches import response_cache, unread_counter
+from momus.authentication import token_cache
+from momus.dbindexes import create_indexes
 
 
 @receiver(post_save, sender=User)
@@ -12,8 +19,14 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    instance.userprofile.save()
+def save_user_profile(sender, instance, created, update_fields=None, **kwargs):
+    # Zapisuje tylko profil wczytany razem z użytkownikiem;
+    # DirtyFieldsMixin pomija zapis, jeśli nic się nie zmieniło.
+    profile = getattr(instance, User.userprofile.related.get_cache_name(), None)
+    if profile is not None:
+        profile.save()
+    if not created and update_fields != frozenset(['last_login']):
+        token_cache.invalidate_user(instance.pk)
 
 
 @receiver(post_delete, sender=UserProfile)
@@ -21,33 +34,82 @@ def post_delete_user(sender, instance, *args, **kwargs):
     instance.user.delete()
 
 
-@receiver(post_delete, sender=Comment)
-def remove_subcomments(sender, instance, *args, **kwargs):
-    for comment in Comment.objects.filter(parent=instance):
-        comment.delete()
+@receiver(post_save, sender=UserProfile)
+def invalidate_cached_tokens(sender, instance, created, **kwargs):
+    if not created:
+        token_cache.invalidate_user(instance.user_id)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    token_cache.invalidate(instance.key)
 
 
 @receiver(post_save, sender=Comment)
 def notify_about_new_comment(sender, instance, created, **kwargs):
     if created:
-        Notification.objects.create(user=instance.author, type=Notification.COMMENT, data=str(instance.post.slug))
+        notification_queue.put(user_id=instance.author_id, type=Notification.COMMENT, data=str(instance.post.slug))
+
+
+@receiver(pre_save, sender=Message)
+def normalize_message_participants(sender, instance, **kwargs):
+    instance.low_participant, instance.high_participant = sorted((instance.sender_id, instance.reciver_id))
+
+
+@receiver(post_save, sender=Message)
+def update_conversations(sender, instance, created, **kwargs):
+    if created:
+        Conversation.objects.record_message(instance)
+        unread_counter.invalidate(instance.reciver_id)
 
 
 @receiver(post_save, sender=Message)
 def notify_about_new_message(sender, instance, created, **kwargs):
     if created:
-        Notification.objects.create(user=instance.reciver, type=Notification.MESSAGE, data=str(instance.sender))
+        notification_queue.put(user_id=instance.reciver_id, type=Notification.MESSAGE, data=str(instance.sender))
 
 
 @receiver(post_delete, sender=Post)
 def notify_about_removed_post(sender, instance, *args, **kwargs):
-    Notification.objects.create(user=instance.author, type=Notification.REMOVE, data=str(instance.title))
+    notification_queue.put(user_id=instance.author_id, type=Notification.REMOVE, data=str(instance.title))
+
+
+@receiver(post_save, sender=Comment)
+def increment_comment_count(sender, instance, created, **kwargs):
+    if created and instance.is_active:
+        Post.objects.filter(pk=instance.post_id).update(comment_count=F('comment_count') + 1)
+
 
+@receiver(post_delete, sender=Comment)
+def decrement_comment_count(sender, instance, *args, **kwargs):
+    if instance.is_active:
+        Post.objects.filter(pk=instance.post_id, comment_count__gt=0).update(comment_count=F('comment_count') - 1)
 
 
+@receiver(post_save, sender=Favorite)
+def increment_favorite_count(sender, instance, created, **kwargs):
+    if created:
+        Post.objects.filter(pk=instance.post_id).update(favorite_count=F('favorite_count') + 1)
 
 
+@receiver(post_delete, sender=Favorite)
+def decrement_favorite_count(sender, instance, *args, **kwargs):
+    Post.objects.filter(pk=instance.post_id, favorite_count__gt=0).update(favorite_count=F('favorite_count') - 1)
 
 
+@receiver([post_save, post_delete], sender=Post)
+@receiver([post_save, post_delete], sender=Comment)
+@receiver([post_save, post_delete], sender=Favorite)
+@receiver([post_save, post_delete], sender=UserProfile)
+@receiver([post_save, post_delete], sender=User)
+def invalidate_post_responses(sender, instance, update_fields=None, **kwargs):
+    # Odpowiedzi z postami zawierają autora (nazwę, zdjęcie); samo logowanie (last_login) ich nie zmienia.
+    if sender is User and update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    response_cache.invalidate()
 
 
+@receiver(post_migrate)
+def create_database_indexes(sender, using, **kwargs):
+    if sender.name == 'momus':
+        create_indexes(using)
@@ -1,10 +1,38 @@
+import json
+import os
+from datetime import timedelta
+from base64 import b64decode, b64encode, encodebytes
+from io import BytesIO, StringIO
+from tempfile import TemporaryDirectory
+from threading import Barrier, Thread, Timer
+from unittest import mock
+
 from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, transaction, IntegrityError, OperationalError
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from django.utils.text import slugify
 
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APITestCase, APITransactionTestCase
 from rest_framework.authtoken.models import Token
 
-from momus.models import UserProfile
+from PIL import Image
+
+from momus.models import UserProfile, Post, Comment, Favorite, Message, Notification, Conversation, ThrottleCounter,\
+                         Vote, PostVote, CommentVote, ReportedComment
+from momus.notifications import notification_queue
+from momus.caches import response_cache
+from momus.authentication import token_cache
+from momus.rowserializers import get_row_serializer
+from momus.serializers import PostSerializer, ImageBase64Field
+from momus.images import image_pipeline
+from momus.pubsub import LocalBroker, PostgresBroker
+from momus.throttles import CacheRateStore, WriteRateThrottle
+from momus.metrics import MetricsRegistry
+from momus.profiling import ProfileStore
 
 
 class BaseApiTest(APITestCase):
@@ -15,6 +43,8 @@ class BaseApiTest(APITestCase):
         self.test_user = UserProfile.objects.get(user=user)
         self.test_user_token = Token.objects.create(user=user, key='RANDOMuserTOKEN')
         self.USERS_REGISTERED = 1
+        response_cache.cache.clear()
+        token_cache.cache.clear()
 
 
 class RegistrationTests(BaseApiTest):
@@ -81,3 +111,913 @@ class LoginTests(BaseApiTest):
         data = {'email': 'wrong@test.com', 'password': 'wrongpassword'}
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class PostPaginationTests(BaseApiTest):
+
+    def setUp(self):
+        super(PostPaginationTests, self).setUp()
+        for number in range(25):
+            Post.objects.create(author=self.test_user, title='Post {}'.format(number), slug='post-{}'.format(number),
+                                image='images/test.png', tags=['test'])
+
+    def test_cursor_pagination_walks_whole_feed_without_count(self):
+        url = '/api/posts/?page_size=10'
+        slugs = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertFalse('count' in response.data)
+            slugs.extend(post['slug'] for post in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(len(slugs), 25)
+        self.assertEqual(slugs, list(Post.objects.values_list('slug', flat=True)))
+
+    def test_previous_cursor_returns_previous_page(self):
+        first_page = self.client.get('/api/posts/').data
+        second_page = self.client.get(first_page['next']).data
+        self.assertEqual(self.client.get(second_page['previous']).data['results'], first_page['results'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/posts/?cursor=invalid')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class PostCountersTests(BaseApiTest):
+
+    def setUp(self):
+        super(PostCountersTests, self).setUp()
+        self.post = Post.objects.create(author=self.test_user, title='Post', slug='post', image='images/test.png',
+                                        tags=['test'])
+
+    def test_counters_follow_comments_and_favorites(self):
+        comment = Comment.objects.create(author=self.test_user, post=self.post, text='Komentarz')
+        favorite = Favorite.objects.create(user=self.test_user, post=self.post)
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.comment_count, self.post.favorite_count), (1, 1))
+        comment.delete()
+        favorite.delete()
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.comment_count, self.post.favorite_count), (0, 0))
+
+    def test_recount_posts_command(self):
+        Comment.objects.create(author=self.test_user, post=self.post, text='Komentarz')
+        Post.objects.filter(pk=self.post.pk).update(comment_count=10, favorite_count=3)
+        call_command('recount_posts', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.comment_count, self.post.favorite_count), (1, 0))
+
+
+class NotificationQueueTests(APITransactionTestCase):
+
+    def setUp(self):
+        self.sender = User.objects.create_user(username='sender', password='sender123password').userprofile
+        self.reciver = User.objects.create_user(username='reciver', password='reciver123password').userprofile
+
+    def test_notifications_are_written_in_one_batch_after_commit(self):
+        notification_queue.flush()
+        for number in range(3):
+            Message.objects.create(sender=self.sender, reciver=self.reciver, title='Tytuł', text=str(number))
+        self.assertEqual(Notification.objects.count(), 0)
+        with self.assertNumQueries(1):
+            self.assertEqual(notification_queue.flush(), 3)
+        self.assertEqual(Notification.objects.filter(user=self.reciver, type=Notification.MESSAGE).count(), 3)
+
+    def test_events_are_published_once_per_batch(self):
+        notification_queue.flush()
+        for number in range(3):
+            Message.objects.create(sender=self.sender, reciver=self.reciver, title='Tytuł', text=str(number))
+        with mock.patch('momus.notifications.event_broker') as broker:
+            notification_queue.flush()
+        events, = broker.publish_many.call_args[0]
+        self.assertEqual(broker.publish_many.call_count, 1)
+        self.assertEqual([user_id for user_id, _ in events], [self.reciver.pk] * 3)
+
+    def test_failed_batch_is_kept_and_not_published(self):
+        notification_queue.flush()
+        Message.objects.create(sender=self.sender, reciver=self.reciver, title='Tytuł', text='Tekst')
+        with mock.patch('momus.notifications.event_broker') as broker:
+            with mock.patch.object(Notification.objects, 'bulk_create', side_effect=OperationalError):
+                self.assertEqual(notification_queue.flush(), 0)
+            self.assertFalse(broker.publish_many.called)
+            self.assertEqual(notification_queue.flush(), 1)
+            self.assertEqual(broker.publish_many.call_count, 1)
+        self.assertEqual(Notification.objects.filter(user=self.reciver).count(), 1)
+
+    def test_nothing_is_queued_when_transaction_is_rolled_back(self):
+        notification_queue.flush()
+        try:
+            with transaction.atomic():
+                Message.objects.create(sender=self.sender, reciver=self.reciver, title='Tytuł', text='Tekst')
+                raise IntegrityError
+        except IntegrityError:
+            pass
+        self.assertEqual(notification_queue.flush(), 0)
+
+
+class CommentTreeDeletionTests(BaseApiTest):
+
+    def setUp(self):
+        super(CommentTreeDeletionTests, self).setUp()
+        self.post = Post.objects.create(author=self.test_user, title='Post', slug='post', image='images/test.png',
+                                        tags=['test'])
+
+    def create_thread(self, size):
+        root = parent = Comment.objects.create(author=self.test_user, post=self.post, text='0')
+        for number in range(1, size):
+            parent = Comment.objects.create(author=self.test_user, post=self.post, text=str(number),
+                                            parent=parent if number % 2 else root)
+        return root
+
+    def count_delete_queries(self, size):
+        root = self.create_thread(size)
+        with CaptureQueriesContext(connection) as queries:
+            deleted = Comment.objects.filter(pk=root.pk).delete_tree()
+        self.assertEqual(deleted, size)
+        return len(queries)
+
+    def test_delete_tree_query_count_is_constant_in_thread_size(self):
+        self.assertEqual(self.count_delete_queries(5), self.count_delete_queries(100))
+        self.assertFalse(Comment.objects.exists())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 0)
+
+    def test_deactivate_tree_keeps_other_threads(self):
+        root = self.create_thread(10)
+        other = Comment.objects.create(author=self.test_user, post=self.post, text='inny')
+        self.assertEqual(Comment.objects.filter(pk=root.pk).deactivate_tree(), 10)
+        self.assertEqual(list(Comment.objects.filter(is_active=True)), [other])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+
+    def test_admin_action_hides_reported_thread(self):
+        root = self.create_thread(4)
+        report = ReportedComment.objects.create(author=self.test_user, comment=root, text='Spam')
+        User.objects.filter(pk=self.test_user.user_id).update(is_staff=True, is_superuser=True)
+        self.client.login(username='user', password='user123password')
+        self.client.post('/admin/momus/reportedcomment/', {'action': 'deactivate_reported_threads',
+                                                           '_selected_action': [report.pk]})
+        self.assertFalse(Comment.objects.filter(is_active=True).exists())
+        self.assertFalse(ReportedComment.objects.get(pk=report.pk).is_pending)
+
+
+class CommentTreeEndpointTests(BaseApiTest):
+
+    def setUp(self):
+        super(CommentTreeEndpointTests, self).setUp()
+        self.post = Post.objects.create(author=self.test_user, title='Post', slug='post', image='images/test.png',
+                                        tags=['test'])
+        self.root = Comment.objects.create(author=self.test_user, post=self.post, text='root')
+        self.replies = [Comment.objects.create(author=self.test_user, post=self.post, parent=self.root, text=str(i))
+                        for i in range(3)]
+        Comment.objects.create(author=self.test_user, post=self.post, parent=self.replies[0], text='deep')
+
+    def test_tree_is_nested_and_fetched_with_constant_queries(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/posts/post/comments/tree/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        root = response.data[0]
+        self.assertEqual((root['text'], root['repliesCount']), ('root', 3))
+        self.assertEqual([reply['text'] for reply in root['replies']], ['0', '1', '2'])
+        self.assertEqual(root['replies'][0]['replies'][0]['text'], 'deep')
+        self.assertEqual(root['author']['user']['username'], 'user')
+
+    def test_depth_and_sibling_limits(self):
+        response = self.client.get('/api/posts/post/comments/tree/?depth=2&siblings=2')
+        root = response.data[0]
+        self.assertEqual(root['repliesCount'], 3)
+        self.assertEqual(len(root['replies']), 2)
+        self.assertEqual(root['replies'][0]['replies'], [])
+
+    def test_invalid_limit(self):
+        response = self.client.get('/api/posts/post/comments/tree/?depth=0')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class QueryBudgetTests(BaseApiTest):
+
+    def setUp(self):
+        super(QueryBudgetTests, self).setUp()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.test_user_token.key)
+        for number in range(5):
+            author = User.objects.create_user(username='author{}'.format(number), password='author123password')
+            post = Post.objects.create(author=author.userprofile, title='Post', slug='post-{}'.format(number),
+                                       image='images/test.png', tags=['test'])
+            Favorite.objects.create(user=self.test_user, post=post)
+            Comment.objects.create(author=author.userprofile, post=post, text='Komentarz')
+            Message.objects.create(sender=author.userprofile, reciver=self.test_user, title='Tytuł', text='Tekst')
+            Notification.objects.create(user=self.test_user, type=Notification.COMMENT, data=post.slug)
+
+    def assertConstantListQueries(self, url, page_sizes=(1, 25)):
+        """Liczba zapytań endpointu listy nie może zależeć od wielkości strony."""
+        self.client.get(url)
+        counts = []
+        for page_size in page_sizes:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, {'page_size': page_size})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            counts.append(len(queries))
+        self.assertEqual(len(set(counts)), 1, 'Zapytania {} dla stron {}: {}'.format(url, page_sizes, counts))
+
+    def test_list_endpoints_have_constant_query_count(self):
+        for url in ('/api/users/', '/api/posts/', '/api/favorites/', '/api/comments/', '/api/unread-messages/',
+                    '/api/notifications/'):
+            self.assertConstantListQueries(url)
+
+
+class RowSerializerTests(BaseApiTest):
+
+    def test_row_serializer_matches_model_serializer(self):
+        Post.objects.create(author=self.test_user, title='Post', slug='post', image='images/test.png',
+                            tags=['a', 'b'])
+        row_serializer = get_row_serializer(PostSerializer)
+        rows = Post.objects.values(*row_serializer.columns)
+        self.assertEqual(row_serializer.to_representation(rows), PostSerializer(Post.objects.all(), many=True).data)
+
+    def test_list_endpoints_use_same_output_format(self):
+        Post.objects.create(author=self.test_user, title='Post', slug='post', image='images/test.png', tags=['a'])
+        post = self.client.get('/api/posts/').data['results'][0]
+        self.assertEqual(post['author']['user']['firstName'], 'John')
+        self.assertEqual(post['isPending'], True)
+        self.assertTrue(post['image'].endswith('/media/images/test.png'))
+
+
+class ResponseCacheTests(BaseApiTest):
+
+    def setUp(self):
+        super(ResponseCacheTests, self).setUp()
+        self.post = Post.objects.create(author=self.test_user, title='Post', slug='post', image='images/test.png',
+                                        tags=['test'])
+
+    def test_anonymous_feed_is_cached_with_etag(self):
+        first = self.client.get('/api/posts/?tags=test')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/posts/?tags=test')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+        response = self.client.get('/api/posts/?tags=test', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_if_none_match_compares_whole_etags(self):
+        etag = self.client.get('/api/posts/').get('ETag')
+        for header, expected in (('"other", W/{}'.format(etag), status.HTTP_304_NOT_MODIFIED),
+                                 ('*', status.HTTP_304_NOT_MODIFIED),
+                                 (etag[:-2] + '"', status.HTTP_200_OK),
+                                 ('"x{}"'.format(etag.strip('"')), status.HTTP_200_OK)):
+            response = self.client.get('/api/posts/', HTTP_IF_NONE_MATCH=header)
+            self.assertEqual(response.status_code, expected, header)
+
+    def test_cache_is_invalidated_by_new_comment(self):
+        first = self.client.get('/api/posts/post/')
+        Comment.objects.create(author=self.test_user, post=self.post, text='Komentarz')
+        second = self.client.get('/api/posts/post/')
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second.data['commentCount'], 1)
+
+    def test_cache_is_invalidated_by_comment_tree_deletion(self):
+        comment = Comment.objects.create(author=self.test_user, post=self.post, text='Komentarz')
+        first = self.client.get('/api/posts/post/')
+        self.assertEqual(first.data['commentCount'], 1)
+        Comment.objects.filter(pk=comment.pk).delete_tree()
+        second = self.client.get('/api/posts/post/')
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second.data['commentCount'], 0)
+
+    def test_cache_is_invalidated_by_author_profile_change(self):
+        first = self.client.get('/api/posts/post/')
+        self.test_user.user.username = 'renamed'
+        self.test_user.user.save()
+        second = self.client.get('/api/posts/post/')
+        self.assertNotEqual(second['ETag'], first['ETag'])
+
+    def test_evicted_version_does_not_revive_old_entries(self):
+        first = self.client.get('/api/posts/post/')
+        response_cache.invalidate()
+        response_cache.cache.delete(response_cache.version_key)
+        Post.objects.filter(pk=self.post.pk).update(title='Nowy tytuł')
+        second = self.client.get('/api/posts/post/')
+        self.assertNotEqual(second['ETag'], first['ETag'])
+
+    def test_authenticated_requests_are_not_cached(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.test_user_token.key)
+        response = self.client.get('/api/posts/')
+        self.assertFalse(response.has_header('ETag'))
+
+
+class TagTests(BaseApiTest):
+
+    def setUp(self):
+        super(TagTests, self).setUp()
+        for slug, tags in (('cats', ['cat', 'funny']), ('dogs', ['dog', 'funny']), ('birds', ['bird', ''])):
+            Post.objects.create(author=self.test_user, title=slug, slug=slug, image='images/test.png', tags=tags)
+
+    def get_slugs(self, query):
+        return sorted(post['slug'] for post in self.client.get('/api/posts/?' + query).data['results'])
+
+    def test_all_of_and_any_of_tag_filters(self):
+        self.assertEqual(self.get_slugs('tags=cat,funny'), ['cats'])
+        self.assertEqual(self.get_slugs('tags_any=cat,dog'), ['cats', 'dogs'])
+
+    def test_popular_tags_from_refreshed_table(self):
+        call_command('refresh_tag_counts', stdout=StringIO())
+        response = self.client.get('/api/tags/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0], {'tag': 'funny', 'count': 2})
+        self.assertEqual(response.data['count'], 4)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.test_user_token.key)
+        self.assertEqual(self.client.post('/api/tags/', {'tag': 'nowy', 'count': 1}).status_code,
+                         status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+class ImagePipelineTests(BaseApiTest):
+
+    @staticmethod
+    def encode_image(image_format, size=(640, 480)):
+        buffer = BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, image_format)
+        return 'data:image/{};base64,{}'.format(image_format.lower(), b64encode(buffer.getvalue()).decode('ascii'))
+
+    def test_base64_field_detects_real_format(self):
+        image = ImageBase64Field().to_internal_value(self.encode_image('JPEG'))
+        self.assertTrue(image.name.endswith('.jpg'))
+
+    def test_base64_field_accepts_line_wrapped_data(self):
+        prefix, encoded = self.encode_image('PNG').split(',', 1)
+        wrapped = encodebytes(b64decode(encoded)).decode('ascii')
+        field = ImageBase64Field()
+        field.chunk_size = 1000
+        image = field.to_internal_value(prefix + ',' + wrapped)
+        self.assertEqual(image.read(), b64decode(encoded))
+
+    def test_base64_field_rejects_invalid_data(self):
+        truncated = self.encode_image('PNG')[:-40]
+        for data in ('no-comma', 'data:image/png;base64,!!!', 'data:image/png;base64,' + b64encode(b'text').decode(),
+                     truncated):
+            with self.assertRaises(ValidationError):
+                ImageBase64Field().to_internal_value(data)
+
+    def test_variants_are_generated_and_exposed(self):
+        with TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            post = Post.objects.create(author=self.test_user, title='Post', slug='post', tags=['test'],
+                                       image=ImageBase64Field().to_internal_value(self.encode_image('PNG')))
+            self.assertEqual(self.client.get('/api/posts/post/').data['imageVariants'], {})
+            names = image_pipeline.process(Post, post.pk, 'image', post.image.name)
+            self.assertTrue(all(os.path.exists(os.path.join(media_root, name)) for name in names))
+            variants = self.client.get('/api/posts/post/').data['imageVariants']
+        self.assertTrue(variants['thumbnail'].endswith('/thumbnail.jpg'))
+        self.assertTrue(variants['medium'].endswith('/medium.jpg'))
+
+
+class ConversationTests(BaseApiTest):
+
+    def setUp(self):
+        super(ConversationTests, self).setUp()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.test_user_token.key)
+        self.friend = User.objects.create_user(username='friend', password='friend123password').userprofile
+        self.other = User.objects.create_user(username='other', password='other123password').userprofile
+        for text in ('a', 'b'):
+            Message.objects.create(sender=self.friend, reciver=self.test_user, title='Tytuł', text=text)
+        Message.objects.create(sender=self.test_user, reciver=self.other, title='Tytuł', text='c')
+
+    def test_inbox_is_ordered_by_recency_with_unread_counts(self):
+        response = self.client.get('/api/messages/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([(item['user']['user']['username'], item['unreadCount'], item['lastMessage']['text'])
+                          for item in response.data], [('other', 0, 'c'), ('friend', 2, 'b')])
+
+    def test_reading_message_updates_unread_count(self):
+        message = Message.objects.filter(reciver=self.test_user).first()
+        response = self.client.patch('/api/unread-messages/{}/'.format(message.pk), {})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Conversation.objects.get(owner=self.test_user, partner=self.friend).unread_count, 1)
+
+    def test_rebuild_conversations_command(self):
+        expected = list(Conversation.objects.order_by('pk').values_list('owner', 'partner', 'last_message',
+                                                                         'unread_count'))
+        call_command('rebuild_conversations', stdout=StringIO())
+        self.assertEqual(sorted(Conversation.objects.values_list('owner', 'partner', 'last_message', 'unread_count')),
+                         sorted(expected))
+
+
+class ConversationHistoryTests(BaseApiTest):
+
+    def setUp(self):
+        super(ConversationHistoryTests, self).setUp()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.test_user_token.key)
+        self.friend = User.objects.create_user(username='friend', password='friend123password').userprofile
+        self.messages = [Message.objects.create(sender=self.friend, reciver=self.test_user, title='Tytuł',
+                                                text=str(number)) for number in range(30)]
+
+    def test_history_is_paginated_newest_first(self):
+        first_page = self.client.get('/api/messages/friend/').data
+        self.assertEqual([message['text'] for message in first_page['results']],
+                         [str(number) for number in range(29, 4, -1)])
+        older = self.client.get(first_page['next']).data
+        self.assertEqual([message['text'] for message in older['results']], ['4', '3', '2', '1', '0'])
+        self.assertIsNone(older['next'])
+
+    def test_mark_conversation_read_up_to_message(self):
+        response = self.client.post('/api/messages/friend/read/', {'upTo': self.messages[9].pk})
+        self.assertEqual(response.data, {'updated': 10})
+        self.assertEqual(Conversation.objects.get(owner=self.test_user).unread_count, 20)
+        response = self.client.post('/api/messages/friend/read/')
+        self.assertEqual(response.data, {'updated': 20})
+        self.assertFalse(Message.objects.filter(is_read=False).exists())
+
+
+class BulkReadTests(BaseApiTest):
+
+    def setUp(self):
+        super(BulkReadTests, self).setUp()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.test_user_token.key)
+        friend = User.objects.create_user(username='friend', password='friend123password').userprofile
+        self.messages = [Message.objects.create(sender=friend, reciver=self.test_user, title='Tytuł', text=str(number))
+                         for number in range(3)]
+        self.notifications = [Notification.objects.create(user=self.test_user, type=Notification.COMMENT)
+                              for number in range(3)]
+
+    def test_mark_notifications_read_by_ids(self):
+        self.assertEqual(self.client.get('/api/unread-count/').data, {'notifications': 3, 'messages': 3})
+        ids = [notification.pk for notification in self.notifications[:2]]
+        with self.assertNumQueries(1):
+            response = self.client.post('/api/notifications/read/', {'ids': ids})
+        self.assertEqual(response.data, {'updated': 2})
+        self.assertEqual(self.client.get('/api/unread-count/').data, {'notifications': 1, 'messages': 3})
+
+    def test_mark_read_up_to_id(self):
+        response = self.client.post('/api/notifications/read/', {'upTo': self.notifications[1].pk})
+        self.assertEqual(response.data, {'updated': 2})
+        response = self.client.post('/api/unread-messages/read/', {'upTo': self.messages[0].pk})
+        self.assertEqual(response.data, {'updated': 1})
+        for url in ('/api/notifications/read/', '/api/messages/friend/read/'):
+            response = self.client.post(url, {'upTo': 'wczoraj'})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_mark_all_unread_messages_read(self):
+        response = self.client.post('/api/unread-messages/read/', {})
+        self.assertEqual(response.data, {'updated': 3})
+        self.assertEqual(Conversation.objects.get(owner=self.test_user).unread_count, 0)
+        self.assertEqual(self.client.get('/api/unread-count/').data['messages'], 0)
+
+    def test_unread_count_is_cached(self):
+        self.client.get('/api/unread-count/')
+        with self.assertNumQueries(0):
+            self.client.get('/api/unread-count/')
+
+    def test_creating_notifications_is_not_allowed(self):
+        response = self.client.post('/api/notifications/', {})
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+class EventTests(BaseApiTest):
+
+    def test_local_broker_delivers_only_to_subscribed_user(self):
+        broker = LocalBroker()
+        subscription = broker.subscribe(1)
+        broker.publish(2, {'type': 'MESSAGE'})
+        broker.publish(1, {'type': 'COMMENT'})
+        self.assertEqual(subscription.get(timeout=0), {'type': 'COMMENT'})
+        self.assertIsNone(subscription.get(timeout=0))
+        subscription.close()
+        broker.publish(1, {'type': 'COMMENT'})
+        self.assertIsNone(subscription.get(timeout=0))
+
+    def test_postgres_broker_publishes_batch_in_one_query(self):
+        with self.assertNumQueries(1):
+            PostgresBroker().publish_many([(1, {'type': 'COMMENT'}), (2, {'type': 'MESSAGE'})])
+
+    def test_long_poll_returns_dispatched_events(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.test_user_token.key)
+        event = {'type': Notification.MESSAGE, 'data': 'friend'}
+        broker = LocalBroker()
+        timer = Timer(0.2, broker.publish, (self.test_user.pk, event))
+        with mock.patch('momus.views.event_broker', broker):
+            timer.start()
+            response = self.client.get('/api/events/poll/?timeout=5')
+        timer.join()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [event])
+
+    def test_stream_errors_rendered_as_json(self):
+        response = self.client.get('/api/events/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn('detail', json.loads(response.content.decode()))
+
+
+class FeedRankingTests(BaseApiTest):
+
+    def setUp(self):
+        super(FeedRankingTests, self).setUp()
+        for slug, rate, favorites in (('old-top', 50, 10), ('fresh', 3, 1), ('flat', 0, 0), ('flat-2', 0, 0)):
+            Post.objects.create(author=self.test_user, title=slug, slug=slug, image='images/test.png', tags=[],
+                                rate=rate, favorite_count=favorites)
+        Post.objects.filter(slug='old-top').update(create_date=timezone.now() - timedelta(days=30))
+        call_command('refresh_rankings', stdout=StringIO())
+        Post.objects.create(author=self.test_user, title='unranked', slug='unranked', image='images/test.png', tags=[])
+
+    def get_slugs(self, url):
+        slugs = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            slugs.extend(post['slug'] for post in response.data['results'])
+            url = response.data['next']
+        return slugs
+
+    def test_feeds_read_ranking_table_with_keyset_pagination(self):
+        self.assertEqual(self.get_slugs('/api/posts/?sort=top&page_size=1'), ['old-top', 'fresh', 'flat-2', 'flat'])
+        self.assertEqual(self.get_slugs('/api/posts/?sort=hot&page_size=3'), ['fresh', 'old-top', 'flat-2', 'flat'])
+        self.assertEqual(self.get_slugs('/api/posts/?sort=new')[0], 'unranked')
+
+    def test_unknown_sort(self):
+        self.assertEqual(self.client.get('/api/posts/?sort=best').status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class VoteTests(BaseApiTest):
+
+    def setUp(self):
+        super(VoteTests, self).setUp()
+        self.post = Post.objects.create(author=self.test_user, title='Post', slug='post', image='images/test.png',
+                                        tags=[])
+        self.comment = Comment.objects.create(author=self.test_user, post=self.post, text='Komentarz')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.test_user_token.key)
+
+    def test_vote_change_and_withdraw(self):
+        self.assertEqual(self.client.post('/api/posts/post/vote/', {'value': 1}).data, {'rate': 1, 'value': 1})
+        self.assertEqual(self.client.post('/api/posts/post/vote/', {'value': 1}).data['rate'], 1)
+        self.assertEqual(self.client.post('/api/posts/post/vote/', {'value': -1}).data['rate'], -1)
+        self.assertEqual(self.client.delete('/api/posts/post/vote/').data['rate'], 0)
+        self.assertFalse(PostVote.objects.exists())
+        response = self.client.post('/api/posts/post/vote/', {'value': 5})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_comment_votes_removed_with_tree(self):
+        url = '/api/comments/{}/vote/'.format(self.comment.pk)
+        self.assertEqual(self.client.post(url, {'value': -1}).data['rate'], -1)
+        Comment.objects.filter(pk=self.comment.pk).delete_tree()
+        self.assertFalse(CommentVote.objects.exists())
+
+    def test_recount_restores_rates_from_votes(self):
+        PostVote.objects.cast(self.test_user, self.post, Vote.UP)
+        Post.objects.update(rate=40000)
+        call_command('recount_votes', stdout=StringIO())
+        self.assertEqual(Post.objects.get().rate, 1)
+
+
+class VoteConcurrencyTests(APITransactionTestCase):
+
+    def setUp(self):
+        self.voters = [User.objects.create_user(username='voter{}'.format(number),
+                                                password='voter123password').userprofile for number in range(12)]
+        self.post = Post.objects.create(author=self.voters[0], title='Post', slug='post', image='images/test.png',
+                                        tags=[])
+
+    def vote_in_parallel(self, votes):
+        barrier = Barrier(len(votes))
+        errors = []
+
+        def vote(voter, value):
+            try:
+                barrier.wait()
+                PostVote.objects.cast(voter, self.post, value)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [Thread(target=vote, args=args) for args in votes]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return Post.objects.get(pk=self.post.pk).rate
+
+    def test_parallel_votes_are_not_lost(self):
+        self.assertEqual(self.vote_in_parallel([(voter, Vote.UP) for voter in self.voters * 2]), 12)
+        self.assertEqual(self.vote_in_parallel([(voter, Vote.DOWN) for voter in self.voters[:4] * 2]), 4)
+        self.assertEqual(PostVote.objects.count(), 12)
+
+
+class SlugAllocationTests(APITransactionTestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='author123password').userprofile
+
+    def create_post(self, title='Kot'):
+        return Post.objects.create_with_slug(slugify(title), author=self.author, title=title,
+                                             image='images/test.png', tags=[])
+
+    def test_next_free_suffix_in_one_query(self):
+        for slug in ('kot', 'kot-1', 'kot-7', 'kot-domowy', 'kotek-3'):
+            Post.objects.create(author=self.author, title='Kot', slug=slug, image='images/test.png', tags=[])
+        with self.assertNumQueries(1):
+            self.assertEqual(Post.objects.next_free_slug('kot'), 'kot-8')
+        self.assertEqual(Post.objects.next_free_slug('pies'), 'pies')
+        self.assertEqual(self.create_post('Kot domowy').slug, 'kot-domowy-1')
+
+    def test_concurrent_creates_get_distinct_slugs(self):
+        barrier = Barrier(4)
+        slugs, errors = [], []
+
+        def create():
+            try:
+                barrier.wait()
+                slugs.append(self.create_post().slug)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [Thread(target=create) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(slugs), ['kot', 'kot-1', 'kot-2', 'kot-3'])
+
+
+class SearchTests(BaseApiTest):
+
+    def setUp(self):
+        super(SearchTests, self).setUp()
+        self.cat = Post.objects.create(author=self.test_user, title='Rudy kot', slug='rudy-kot',
+                                       image='images/test.png', tags=['zwierzęta'])
+        dog = Post.objects.create(author=self.test_user, title='Pies', slug='pies', image='images/test.png',
+                                  tags=['kot', 'pies'])
+        Comment.objects.create(author=self.test_user, post=dog, text='Ten kot jest lepszy')
+        Comment.objects.create(author=self.test_user, post=dog, text='Nieaktywny kot', is_active=False)
+        User.objects.create_user(username='kotlarz', password='kotlarz123password')
+
+    def test_posts_ranked_by_weighted_vector(self):
+        response = self.client.get('/api/search/?q=kot&type=posts')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([post['slug'] for post in response.data['posts']], ['rudy-kot', 'pies'])
+        self.assertNotIn('comments', response.data)
+
+    def test_vector_follows_updates(self):
+        Post.objects.filter(pk=self.cat.pk).update(title='Rudy lis')
+        response = self.client.get('/api/search/?q=lis')
+        self.assertEqual([post['slug'] for post in response.data['posts']], ['rudy-kot'])
+        self.assertEqual(response.data['comments'], [])
+
+    def test_comments_and_users(self):
+        response = self.client.get('/api/search/?q=kot')
+        self.assertEqual([comment['text'] for comment in response.data['comments']], ['Ten kot jest lepszy'])
+        self.assertEqual([user['user']['username'] for user in response.data['users']], ['kotlarz'])
+        self.assertEqual(self.client.get('/api/search/?q=us&type=users').data['users'][0]['user']['username'], 'user')
+
+    def test_query_is_required(self):
+        self.assertEqual(self.client.get('/api/search/').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get('/api/search/?q=kot&type=tags').status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class QueryPlanIndexTests(BaseApiTest):
+
+    def test_canonical_queries_use_indexes(self):
+        post = Post.objects.create(author=self.test_user, title='Kot', slug='kot', image='images/test.png', tags=[])
+        Comment.objects.create(author=self.test_user, post=post, text='Komentarz')
+        output = StringIO()
+        call_command('explain_queries', stdout=output)
+        self.assertNotIn('Seq Scan', output.getvalue())
+
+
+class CachedTokenAuthenticationTests(BaseApiTest):
+
+    def setUp(self):
+        super(CachedTokenAuthenticationTests, self).setUp()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.test_user_token.key)
+
+    def test_token_user_and_profile_resolved_once(self):
+        # jedno zapytanie o token z użytkownikiem i profilem oraz dwa o liczniki nieprzeczytanych
+        with self.assertNumQueries(3):
+            self.assertEqual(self.client.get('/api/unread-count/').status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/unread-count/').status_code, status.HTTP_200_OK)
+
+    def test_profile_save_and_token_delete_invalidate_cache(self):
+        self.client.get('/api/unread-count/')
+        self.test_user.city = 'Gdańsk'
+        self.test_user.save()
+        self.assertIsNone(token_cache.get(self.test_user_token.key))
+        self.client.get('/api/unread-count/')
+        self.assertEqual(token_cache.get(self.test_user_token.key).user.userprofile.city, 'Gdańsk')
+        self.test_user_token.delete()
+        response = self.client.get('/api/unread-count/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class DirtyFieldsTests(BaseApiTest):
+
+    def capture_updates(self, action):
+        with CaptureQueriesContext(connection) as queries:
+            action()
+        return [query['sql'] for query in queries if query['sql'].startswith('UPDATE')]
+
+    def test_unchanged_save_is_skipped(self):
+        profile = UserProfile.objects.get(pk=self.test_user.pk)
+        self.assertEqual(self.capture_updates(profile.save), [])
+
+    def test_only_changed_columns_are_written(self):
+        profile = UserProfile.objects.get(pk=self.test_user.pk)
+        profile.city = 'Gdańsk'
+        updates = self.capture_updates(profile.save)
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"city"', updates[0])
+        self.assertNotIn('"description"', updates[0])
+        self.assertEqual(UserProfile.objects.get(pk=profile.pk).city, 'Gdańsk')
+
+    def test_fields_left_out_of_update_fields_stay_dirty(self):
+        profile = UserProfile.objects.get(pk=self.test_user.pk)
+        profile.city = 'Gdańsk'
+        profile.description = 'Opis'
+        profile.save(update_fields=['city'])
+        self.assertEqual(profile.get_dirty_fields(), ['description'])
+        profile.save()
+        profile = UserProfile.objects.get(pk=profile.pk)
+        self.assertEqual((profile.city, profile.description), ('Gdańsk', 'Opis'))
+
+    def test_in_place_list_change_is_detected(self):
+        post = Post.objects.create(author=self.test_user, title='Post', slug='post', image='images/test.png', tags=[])
+        post = Post.objects.get(pk=post.pk)
+        post.tags.append('kot')
+        updates = self.capture_updates(post.save)
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('"comment_count"', updates[0])
+        self.assertEqual(Post.objects.get(pk=post.pk).tags, ['kot'])
+
+    def test_login_does_not_rewrite_profile(self):
+        updates = self.capture_updates(
+            lambda: self.client.post('/auth/login/', {'email': 'user@test.com', 'password': 'user123password'}))
+        self.assertTrue(any('"last_login"' in update for update in updates))
+        self.assertFalse(any(UserProfile._meta.db_table in update for update in updates))
+
+    def test_reading_message_writes_one_column(self):
+        friend = User.objects.create_user(username='friend', password='friend123password').userprofile
+        message = Message.objects.create(sender=friend, reciver=self.test_user, title='Tytuł', text='Tekst')
+        message = Message.objects.get(pk=message.pk)
+        message.is_read = True
+        updates = self.capture_updates(message.save)
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('"text"', updates[0])
+
+
+class SeedDatasetTests(BaseApiTest):
+
+    def test_seeded_dataset_is_consistent_and_indexed(self):
+        call_command('seed_dataset', '--scale', '0.01', stdout=StringIO())
+        self.assertEqual(User.objects.filter(username__startswith='seed_user_').count(), 10)
+        self.assertEqual(Token.objects.filter(user__username__startswith='seed_user_').count(), 10)
+        self.assertEqual(Post.objects.filter(slug__startswith='seed-post-').count(), 100)
+        self.assertEqual(Comment.objects.count(), 500)
+        self.assertTrue(Comment.objects.filter(parent__isnull=False).exists())
+        self.assertEqual(Message.objects.count(), 200)
+        self.assertEqual(Conversation.objects.count(), Message.objects.values('low_participant', 'high_participant')
+                         .distinct().count() * 2)
+        post = Post.objects.order_by('-comment_count').first()
+        self.assertEqual(post.comment_count, Comment.objects.filter(post=post).count())
+        call_command('explain_queries', stdout=StringIO())
+
+    @override_settings(QUERY_COUNT_HEADER=True)
+    def test_query_count_header(self):
+        Post.objects.create(author=self.test_user, title='Post', slug='post', image='images/test.png', tags=[])
+        response = self.client.get('/api/posts/post/')
+        self.assertEqual(response['X-Query-Count'], '1')
+
+
+class MetricsTests(BaseApiTest):
+
+    @override_settings(METRICS={'ENABLED': True})
+    def test_requests_exported_per_route(self):
+        Post.objects.create(author=self.test_user, title='Post', slug='post', image='images/test.png', tags=[])
+        self.client.get('/api/posts/post/')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        content = response.content.decode()
+        self.assertIn('momus_request_seconds_count{route="PostViewSet.retrieve"}', content)
+        self.assertIn('momus_db_queries_bucket{route="PostViewSet.retrieve",le="+Inf"}', content)
+        self.assertIn('momus_render_seconds_sum{route="PostViewSet.retrieve"}', content)
+
+    def test_endpoint_hidden_from_other_addresses(self):
+        response = self.client.get('/metrics', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_processes_merged_from_directory(self):
+        with TemporaryDirectory() as directory:
+            first, second = MetricsRegistry(directory), MetricsRegistry(directory)
+            first.observe('view.get', db_queries=1)
+            with mock.patch('os.getpid', return_value=-1):
+                second.observe('view.get', db_queries=30)
+                second.flush()
+            content = first.render()
+        self.assertIn('momus_db_queries_count{route="view.get"} 2', content)
+        self.assertIn('momus_db_queries_bucket{route="view.get",le="1"} 1', content)
+        self.assertIn('momus_db_queries_bucket{route="view.get",le="50"} 2', content)
+
+
+class ProfilingTests(BaseApiTest):
+
+    def setUp(self):
+        super(ProfilingTests, self).setUp()
+        Post.objects.create(author=self.test_user, title='Post', slug='post', image='images/test.png', tags=[])
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = ProfileStore(directory.name, max_profiles=2)
+        self.profiling = {'ENABLED': True, 'DIRECTORY': directory.name, 'MAX_PROFILES': 2, 'SAMPLE_RATE': 0.0,
+                          'ROUTES': {'PostViewSet.retrieve': 1.0}, 'HEADER': 'X-Profile'}
+
+    def test_sampled_route_profiled_with_sql(self):
+        with override_settings(PROFILING=self.profiling):
+            response = self.client.get('/api/posts/post/')
+            self.assertNotIn('X-Profile-Id', self.client.get('/api/posts/'))
+        profile, = self.store.list()
+        self.assertEqual(response['X-Profile-Id'], profile['id'])
+        self.assertEqual(profile['route'], 'PostViewSet.retrieve')
+        self.assertEqual(len(profile['queries']), 1)
+        self.assertTrue(os.path.getsize(self.store.path(profile['id'], 'prof')))
+
+    def test_sql_literals_redacted(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.test_user_token.key)
+        with override_settings(PROFILING=self.profiling):
+            profile_id = self.client.get('/api/posts/post/')['X-Profile-Id']
+        with open(self.store.path(profile_id, 'json')) as info_file:
+            info = info_file.read()
+        self.assertNotIn(self.test_user_token.key, info)
+        self.assertNotIn("'post'", info)
+
+    def test_oldest_profiles_pruned(self):
+        with override_settings(PROFILING=self.profiling):
+            ids = [self.client.get('/api/posts/post/')['X-Profile-Id'] for _ in range(3)]
+        self.assertEqual(self.store.ids(), ids[1:])
+
+    def test_header_honoured_only_for_admin(self):
+        self.profiling['ROUTES'] = {}
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.test_user_token.key)
+        with override_settings(PROFILING=self.profiling):
+            self.assertNotIn('X-Profile-Id', self.client.get('/api/posts/', HTTP_X_PROFILE='1'))
+            User.objects.filter(pk=self.test_user.user_id).update(is_staff=True)
+            token_cache.cache.clear()
+            self.assertIn('X-Profile-Id', self.client.get('/api/posts/', HTTP_X_PROFILE='1'))
+
+    def test_admin_lists_and_downloads_profiles(self):
+        User.objects.filter(pk=self.test_user.user_id).update(is_staff=True)
+        self.client.login(username='user', password='user123password')
+        with override_settings(PROFILING=self.profiling):
+            profile_id = self.client.get('/api/posts/post/')['X-Profile-Id']
+            response = self.client.get('/admin/profiles/')
+            self.assertContains(response, 'PostViewSet.retrieve')
+            response = self.client.get('/admin/profiles/{}.prof'.format(profile_id))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(b''.join(response.streaming_content),
+                             open(self.store.path(profile_id, 'prof'), 'rb').read())
+            self.assertEqual(self.client.get('/admin/profiles/settings.prof').status_code,
+                             status.HTTP_404_NOT_FOUND)
+
+
+class ThrottleTests(BaseApiTest):
+
+    def test_database_counter_rolls_windows(self):
+        self.assertEqual(ThrottleCounter.objects.hit('key', 10, 60, 1.0, 100), (0, 1))
+        self.assertEqual(ThrottleCounter.objects.hit('key', 10, 60, 1.0, 100), (0, 2))
+        self.assertEqual(ThrottleCounter.objects.hit('key', 11, 60, 1.0, 100), (2, 1))
+        self.assertEqual(ThrottleCounter.objects.hit('key', 13, 60, 1.0, 100), (0, 1))
+        self.assertEqual(ThrottleCounter.objects.count(), 1)
+
+    def test_database_counter_skips_rejected_requests(self):
+        self.assertEqual(ThrottleCounter.objects.hit('key', 10, 60, 1.0, 2), (0, 1))
+        self.assertEqual(ThrottleCounter.objects.hit('key', 10, 60, 1.0, 2), (0, 2))
+        self.assertIsNone(ThrottleCounter.objects.hit('key', 10, 60, 1.0, 2))
+        self.assertEqual(ThrottleCounter.objects.get(key='key').current, 2)
+        self.assertIsNone(ThrottleCounter.objects.hit('key', 11, 60, 0.9, 2))
+        self.assertEqual(ThrottleCounter.objects.hit('key', 11, 60, 0.4, 2), (2, 1))
+
+    def test_expired_database_counters_removed(self):
+        ThrottleCounter.objects.hit('old', 10, 60, 1.0, 100)
+        ThrottleCounter.objects.hit('new', 11, 60, 1.0, 100)
+        ThrottleCounter.objects.expired(12 * 60).delete()
+        self.assertEqual(list(ThrottleCounter.objects.values_list('key', flat=True)), ['new'])
+
+    def test_cache_counter_rolls_windows(self):
+        store = CacheRateStore()
+        store.cache.clear()
+        self.assertEqual(store.hit('key', 10, 60, 1.0, 100), (0, 1))
+        self.assertEqual(store.hit('key', 10, 60, 1.0, 100), (0, 2))
+        self.assertEqual(store.hit('key', 11, 60, 1.0, 100), (2, 1))
+        self.assertIsNone(store.hit('key', 11, 60, 1.0, 3))
+        self.assertEqual(store.hit('key', 11, 60, 0.5, 3), (2, 2))
+
+    def test_writes_limited_by_scope_rate(self):
+        for slug in ('first', 'second', 'third'):
+            Post.objects.create(author=self.test_user, title=slug, slug=slug, image='images/test.png')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.test_user_token.key)
+        rates = {'favorite': '2/h'}
+        with override_settings(THROTTLE={'RATES': rates}), \
+                mock.patch.object(WriteRateThrottle, 'timer', return_value=3600 * 100):
+            for slug in ('first', 'second'):
+                response = self.client.post('/api/favorites/', {'post_slug': slug})
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            response = self.client.post('/api/favorites/', {'post_slug': 'third'})
+            self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            self.assertEqual(self.client.get('/api/favorites/').status_code, status.HTTP_200_OK)
@@ -1,78 +1,134 @@
+import random
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+
 from rest_framework.throttling import UserRateThrottle
 
+from momus.models import ThrottleCounter
 
-class UserProfileThrottle(UserRateThrottle):
 
-    rate = '10/h'
-    scope = 'userprofile'
+class DatabaseRateStore(object):
+    """
+    Liczniki w tabeli ThrottleCounter: jeden wiersz na klucz, atomowo podbijany przez INSERT ... ON CONFLICT.
 
-    def allow_request(self, request, view):
-        if request.method in ('GET', 'HEAD', 'OPTIONS'):
-            return True
-        return super(UserProfileThrottle, self).allow_request(request, view)
+    Średnio co `cleanup_every` żądań usuwane są wiersze, których okna już minęły (np. anonimowych adresów IP).
+    """
+    cleanup_every = 1000
 
+    def hit(self, key, period, duration, weight, limit):
+        if random.randrange(self.cleanup_every) == 0:
+            ThrottleCounter.objects.expired(period * duration).delete()
+        return ThrottleCounter.objects.hit(key, period, duration, weight, limit)
 
-class PostThrottle(UserRateThrottle):
 
-    rate = '5/h'
-    scope = 'post'
+class CacheRateStore(object):
+    """
+    Liczniki w cache Django: dwa klucze na okno, podbijane przez `add`/`incr`.
 
-    def allow_request(self, request, view):
-        if request.method in ('GET', 'HEAD', 'OPTIONS'):
-            return True
-        return super(PostThrottle, self).allow_request(request, view)
+    Atomowe i współdzielone między workerami przy backendzie memcached/redis,
+    LocMemCache nadaje się jako lokalny zamiennik dla jednego procesu.
+    """
 
+    def __init__(self, alias='default'):
+        self.alias = alias
 
-class FavoriteThrottle(UserRateThrottle):
+    @property
+    def cache(self):
+        return caches[self.alias]
 
-    rate = '25/h'
-    scope = 'favorite'
+    def hit(self, key, period, duration, weight, limit):
+        current_key = '{}:{}'.format(key, period)
+        if self.cache.add(current_key, 1, duration * 2):
+            current = 1
+        else:
+            try:
+                current = self.cache.incr(current_key)
+            except ValueError:
+                self.cache.set(current_key, 1, duration * 2)
+                current = 1
+        previous = self.cache.get('{}:{}'.format(key, period - 1), 0)
+        if previous * weight + current > limit:
+            # Odrzucone żądanie nie zostaje w liczniku, tak jak w DatabaseRateStore.
+            try:
+                self.cache.decr(current_key)
+            except ValueError:
+                pass
+            return None
+        return previous, current
 
-    def allow_request(self, request, view):
-        if request.method in ('GET', 'HEAD', 'OPTIONS'):
-            return True
-        return super(FavoriteThrottle, self).allow_request(request, view)
 
+def create_store():
+    config = getattr(settings, 'THROTTLE', {})
+    if config.get('STORE', 'database') == 'database' and connection.vendor == 'postgresql':
+        return DatabaseRateStore()
+    return CacheRateStore(config.get('CACHE', 'default'))
 
-class MessageThrottle(UserRateThrottle):
 
-    rate = '100/h'
-    scope = 'message'
+throttle_store = create_store()
 
-    def allow_request(self, request, view):
-        if request.method in ('GET', 'HEAD', 'OPTIONS'):
-            return True
-        return super(MessageThrottle, self).allow_request(request, view)
 
+class WriteRateThrottle(UserRateThrottle):
+    """
+    Limit żądań zmieniających dane, liczony przesuwanym oknem na dwóch licznikach.
 
-class CommentThrottle(UserRateThrottle):
+    Żądanie jest przepuszczane, gdy `poprzednie * (1 - upłynęło / okno) + bieżące` nie przekracza limitu,
+    więc pamięć na klucz jest stała niezależnie od limitu. Liczone są tylko przepuszczone żądania, więc
+    ponawiający klient wraca po upływie okna, jak w ScopedRateThrottle. Limity pochodzą z `THROTTLE['RATES'][scope]`.
+    """
+    exempt_methods = ('GET', 'HEAD', 'OPTIONS')
 
-    rate = '25/h'
-    scope = 'comment'
+    def get_rate(self):
+        try:
+            return getattr(settings, 'THROTTLE', {})['RATES'][self.scope]
+        except KeyError:
+            raise ImproperlyConfigured('Brak limitu dla zakresu "{}" w THROTTLE["RATES"].'.format(self.scope))
 
     def allow_request(self, request, view):
-        if request.method in ('GET', 'HEAD', 'OPTIONS'):
+        if request.method in self.exempt_methods or self.rate is None:
             return True
-        return super(CommentThrottle, self).allow_request(request, view)
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        period, self.elapsed = divmod(self.timer(), self.duration)
+        weight = 1 - self.elapsed / self.duration
+        return throttle_store.hit(self.key, int(period), self.duration, weight, self.num_requests) is not None
 
+    def wait(self):
+        return self.duration - self.elapsed
 
-class ReportedPostThrottle(UserRateThrottle):
 
-    rate = '10/h'
-    scope = 'reportedpost'
+class UserProfileThrottle(WriteRateThrottle):
+    scope = 'userprofile'
 
-    def allow_request(self, request, view):
-        if request.method in ('GET', 'HEAD', 'OPTIONS', 'PATCH', 'PUT', 'DELETE'):
-            return True
-        return super(ReportedPostThrottle, self).allow_request(request, view)
 
+class PostThrottle(WriteRateThrottle):
+    scope = 'post'
 
-class ReportedCommentThrottle(UserRateThrottle):
 
-    rate = '15/h'
-    scope = 'reportedcomment'
+class FavoriteThrottle(WriteRateThrottle):
+    scope = 'favorite'
 
-    def allow_request(self, request, view):
-        if request.method in ('GET', 'HEAD', 'OPTIONS', 'PATCH', 'PUT', 'DELETE'):
-            return True
-        return super(ReportedCommentThrottle, self).allow_request(request, view)
+
+class MessageThrottle(WriteRateThrottle):
+    scope = 'message'
+
+
+class CommentThrottle(WriteRateThrottle):
+    scope = 'comment'
+
+
+class VoteThrottle(WriteRateThrottle):
+    scope = 'vote'
+
+
+class ReportedPostThrottle(WriteRateThrottle):
+    scope = 'reportedpost'
+    exempt_methods = ('GET', 'HEAD', 'OPTIONS', 'PATCH', 'PUT', 'DELETE')
+
+
+class ReportedCommentThrottle(WriteRateThrottle):
+    scope = 'reportedcomment'
+    exempt_methods = ('GET', 'HEAD', 'OPTIONS', 'PATCH', 'PUT', 'DELETE')
@@ -4,7 +4,7 @@ from rest_framework.routers import DefaultRouter
 
 from momus.views import UserProfileViewSet, PostViewSet, FavoriteViewSet, CommentViewSet, MessageViewSet,\
                         UnreadMessagesViewSet, ReportedPostViewSet, ReportedCommentViewSet, NotificationViewSet,\
-                        RetrieveCurrentUserProfile
+                        RetrieveCurrentUserProfile, TagViewSet, UnreadCount, EventStream, EventPoll, Search
 
 
 router = DefaultRouter()
@@ -17,8 +17,13 @@ router.register(r'messages', MessageViewSet, 'Message')
 router.register(r'reported-posts', ReportedPostViewSet)
 router.register(r'reported-comment', ReportedCommentViewSet)
 router.register(r'notifications', NotificationViewSet, 'Notification')
+router.register(r'tags', TagViewSet)
 
 urlpatterns = [
     url(r'^users/my-profile/$', RetrieveCurrentUserProfile.as_view()),
+    url(r'^unread-count/$', UnreadCount.as_view()),
+    url(r'^events/$', EventStream.as_view()),
+    url(r'^events/poll/$', EventPoll.as_view()),
+    url(r'^search/$', Search.as_view()),
     url(r'^', include(router.urls)),
 ]
@@ -1,23 +1,41 @@
+import json
+
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection
 from django.db.models import Q
+from django.conf import settings
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from rest_framework.views import Response, status, APIView
-from rest_framework.viewsets import ModelViewSet
+from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
+from rest_framework.decorators import detail_route, list_route
+from rest_framework.exceptions import MethodNotAllowed, ValidationError
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from django_filters.rest_framework import DjangoFilterBackend
 
 from momus.permissions import IsOwnerOrReadOnlyForPost, IsOwnerOrReadOnlyForUserProfile, IsOwnerForFavorite,\
                               IsOwnerOrReadOnlyForComment, IsAdminOrCreateOnly
 from momus.serializers import UserProfileSerializer, PostSerializer, FavoriteSerializer, CommentSerializer,\
                               MessageSerializer, ReportedPostSerializer, ReportedCommentSerializer,\
-                              NotificationSerializer
-from momus.models import UserProfile, Post, Favorite, Comment, Message, ReportedPost, ReportedComment, Notification
+                              NotificationSerializer, CommentTreeSerializer, TagCountSerializer,\
+                              ConversationSerializer, MarkReadSerializer, VoteSerializer
+from momus.models import UserProfile, Post, Favorite, Comment, Message, ReportedPost, ReportedComment, Notification,\
+                         TagCount, Conversation, PostVote, CommentVote
 from momus.filters import PostFilterSet, CommentFilterSet, UserProfileFilter
 from momus.throttles import UserProfileThrottle, PostThrottle, FavoriteThrottle, MessageThrottle, CommentThrottle,\
-                            ReportedPostThrottle, ReportedCommentThrottle
-from momus.paginations import LargeResultsSetPagination, StandardResultsSetPagination
-
-
-class UserProfileViewSet(ModelViewSet):
-    queryset = UserProfile.objects.all().select_related('user')
+                            ReportedPostThrottle, ReportedCommentThrottle, VoteThrottle
+from momus.paginations import LargeResultsSetPagination, KeysetPagination, MessageHistoryPagination
+from momus.caches import ResponseCacheMixin, response_cache, unread_counter
+from momus.pubsub import event_broker
+from momus.renderers import EventStreamRenderer
+from momus.queryplans import QueryPlanMixin
+from momus.rowserializers import RowSerializerListMixin
+from momus.metrics import MetricsMixin, metrics_registry
+
+
+class UserProfileViewSet(MetricsMixin, RowSerializerListMixin, QueryPlanMixin, ModelViewSet):
+    queryset = UserProfile.objects.all()
     serializer_class = UserProfileSerializer
     permission_classes = (IsOwnerOrReadOnlyForUserProfile, )
     throttle_classes = (UserProfileThrottle,)
@@ -29,7 +47,7 @@ class UserProfileViewSet(ModelViewSet):
     pagination_class = LargeResultsSetPagination
 
 
-class RetrieveCurrentUserProfile(APIView):
+class RetrieveCurrentUserProfile(MetricsMixin, APIView):
     serializer_class = UserProfileSerializer
     permission_classes = (IsAuthenticated, )
 
@@ -39,8 +57,28 @@ class RetrieveCurrentUserProfile(APIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class PostViewSet(ModelViewSet):
-    queryset = Post.objects.select_related('author')
+class VoteMixin(object):
+    """Akcja `vote`: POST z `value` (1 albo -1) oddaje lub zmienia głos, DELETE go wycofuje."""
+    vote_model = None
+
+    @detail_route(methods=['post', 'delete'], permission_classes=(IsAuthenticated, ), throttle_classes=(VoteThrottle, ))
+    def vote(self, request, *args, **kwargs):
+        """Głos zalogowanego użytkownika, ocena zmieniana atomowo o różnicę głosów"""
+        target = self.get_object()
+        if request.method == 'DELETE':
+            value = 0
+        else:
+            serializer = VoteSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            value = serializer.validated_data['value']
+        if self.vote_model.objects.cast(request.user.userprofile, target, value):
+            response_cache.invalidate()
+        target.refresh_from_db(fields=['rate'])
+        return Response({'rate': target.rate, 'value': value})
+
+
+class PostViewSet(MetricsMixin, VoteMixin, ResponseCacheMixin, RowSerializerListMixin, QueryPlanMixin, ModelViewSet):
+    queryset = Post.objects.all()
     serializer_class = PostSerializer
     permission_classes = (IsOwnerOrReadOnlyForPost, )
     throttle_classes = (PostThrottle, )
@@ -48,29 +86,73 @@ class PostViewSet(ModelViewSet):
     lookup_field = 'slug'
     filter_backends = (DjangoFilterBackend, )
     filter_class = PostFilterSet
-    pagination_class = StandardResultsSetPagination
+    pagination_class = KeysetPagination
+    vote_model = PostVote
+    feed_orderings = {
+        'new': KeysetPagination.ordering,
+        'hot': ('-ranking__hot', '-id'),
+        'top': ('-ranking__top', '-id'),
+        'rising': ('-ranking__rising', '-id'),
+    }
+
+    @property
+    def feed(self):
+        """Tryb listy z parametru `sort`; hot, top i rising czytają przeliczoną tabelę rankingów."""
+        feed = self.request.query_params.get('sort', 'new')
+        if feed not in self.feed_orderings:
+            raise ValidationError({'sort': 'Dozwolone wartości: {}.'.format(', '.join(sorted(self.feed_orderings)))})
+        return feed
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            self._paginator = self.pagination_class()
+            if self.action == 'list':
+                self._paginator.ordering = self.feed_orderings[self.feed]
+        return self._paginator
+
+    def get_queryset(self):
+        queryset = super(PostViewSet, self).get_queryset()
+        if self.action == 'list' and self.feed != 'new':
+            queryset = queryset.filter(ranking__isnull=False)
+        return queryset
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user.userprofile)
 
-
-class FavoriteViewSet(ModelViewSet):
+    @detail_route(methods=['get'], url_path='comments/tree', url_name='comments-tree')
+    def comments_tree(self, request, slug=None):
+        """Drzewo aktywnych komentarzy posta, pobrane jednym zapytaniem"""
+        try:
+            max_depth = _positive_int_or_none(request.query_params.get('depth'))
+            max_siblings = _positive_int_or_none(request.query_params.get('siblings'))
+        except ValueError:
+            return Response({'detail': 'Parametry depth i siblings muszą być dodatnimi liczbami.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        post = self.get_object()
+        comments = Comment.objects.filter(post=post, is_active=True).select_related('author__user')\
+                                  .order_by('create_date', 'id')
+        return Response(CommentTreeSerializer.build_tree(comments, max_depth, max_siblings))
+
+
+class FavoriteViewSet(MetricsMixin, RowSerializerListMixin, QueryPlanMixin, ModelViewSet):
     serializer_class = FavoriteSerializer
     permission_classes = (IsOwnerForFavorite, )
     throttle_classes = (FavoriteThrottle, )
     http_method_names = ('get', 'options', 'post', 'delete', 'head')
     lookup_field = 'post__slug'
-    pagination_class = StandardResultsSetPagination
+    pagination_class = KeysetPagination
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user.userprofile)
 
     def get_queryset(self):
-        return Favorite.objects.filter(user__user=self.request.user).select_related('post')
+        return Favorite.objects.filter(user__user=self.request.user)
 
 
-class CommentViewSet(ModelViewSet):
+class CommentViewSet(MetricsMixin, VoteMixin, QueryPlanMixin, ModelViewSet):
     queryset = Comment.objects.filter(is_active=True)
+    vote_model = CommentVote
     permission_classes = (IsOwnerOrReadOnlyForComment, )
     serializer_class = CommentSerializer
     throttle_classes = (CommentThrottle, )
@@ -81,78 +163,264 @@ class CommentViewSet(ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(author=self.request.user.userprofile)
 
+    def perform_destroy(self, instance):
+        Comment.objects.filter(pk=instance.pk).delete_tree()
+
 
-class MessageViewSet(ModelViewSet):
+class MessageViewSet(MetricsMixin, QueryPlanMixin, ModelViewSet):
     serializer_class = MessageSerializer
+    select_related_extra = ('sender__user', 'reciver__user')
     permission_classes = (IsAuthenticated, )
     http_method_names = ('get', 'options', 'post', 'head')
     throttle_classes = (MessageThrottle, )
     lookup_field = 'username'
     lookup_value_regex = '[\w.]+'
+    pagination_class = MessageHistoryPagination
 
     def get_queryset(self):
-        return Message.objects.filter(Q(sender__user=self.request.user) |
-                                      Q(reciver__user=self.request.user)).select_related('sender', 'reciver')
+        return Message.objects.filter(Q(sender__user=self.request.user) | Q(reciver__user=self.request.user))
 
     def perform_create(self, serializer):
         serializer.save(sender=self.request.user.userprofile)
 
     def list(self, request, *args, **kwargs):
-        """Lista osób z którymi prowadzono konwersajcę"""
-        current_user = request.user.userprofile
-        users = UserProfile.objects.filter(Q(sender__reciver=current_user) | Q(reciver__sender=current_user))\
-                                   .select_related('user').distinct().order_by('user__first_name')
-        return Response(UserProfileSerializer(users, many=True).data)
+        """Lista rozmów od najnowszej, z ostatnią wiadomością i liczbą nieprzeczytanych"""
+        conversations = Conversation.objects.filter(owner=request.user.userprofile)\
+                                            .select_related('partner__user', 'last_message__sender__user',
+                                                            'last_message__reciver__user')
+        return Response(ConversationSerializer(conversations, many=True, context={'request': request}).data)
 
     def retrieve(self, request, *args, **kwargs):
-        """Lista wiadomości z konkretnym użytkownikiem"""
-        username = self.kwargs[self.lookup_field]
+        """Historia rozmowy z konkretnym użytkownikiem, od najnowszych, stronicowana kursorem"""
         current_user = request.user.userprofile
-        try:
-            other_user = UserProfile.objects.select_related('user').get(user__username=username)
-        except UserProfile.DoesNotExist:
-            return Response(status=status.HTTP_404_NOT_FOUND)
-        messages = Message.objects.filter(Q(sender=current_user) | Q(reciver=current_user),
-                                          Q(sender=other_user) | Q(reciver=other_user))
-        return Response(MessageSerializer(messages, many=True).data)
-
-
-class UnreadMessagesViewSet(ModelViewSet):
+        other_user = get_object_or_404(UserProfile, user__username=self.kwargs[self.lookup_field])
+        low, high = sorted((current_user.pk, other_user.pk))
+        messages = self.filter_queryset(Message.objects.filter(low_participant=low, high_participant=high))
+        page = self.paginate_queryset(messages)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    @detail_route(methods=['post'], throttle_classes=())
+    def read(self, request, username=None):
+        """Oznacza jako przeczytane wiadomości od użytkownika z listy `ids` albo do wiadomości `upTo` włącznie"""
+        current_user = request.user.userprofile
+        other_user = get_object_or_404(UserProfile, user__username=username)
+        received = Message.objects.filter(reciver=current_user, sender=other_user)
+        updated = _filter_read(received.filter(is_read=False), received, request.data).update(is_read=True)
+        Conversation.objects.refresh_unread(owner_id=current_user.pk, partner_id=other_user.pk)
+        unread_counter.invalidate(current_user.pk)
+        return Response({'updated': updated})
+
+
+class BulkReadMixin(object):
+    """Akcja `read` oznaczająca elementy listy jako przeczytane jednym zapytaniem UPDATE."""
+
+    def create(self, request, *args, **kwargs):
+        raise MethodNotAllowed(request.method)
+
+    @list_route(methods=['post'], throttle_classes=())
+    def read(self, request):
+        """Oznacza jako przeczytane elementy z listy `ids` albo wszystkie do elementu `upTo` włącznie"""
+        queryset = self.get_queryset().filter(is_read=False)
+        updated = _filter_read(queryset, self.get_read_anchors(), request.data).update(is_read=True)
+        self.perform_read(request.user.userprofile)
+        return Response({'updated': updated})
+
+    def get_read_anchors(self):
+        """Elementy, których id można podać jako `upTo` (także już przeczytane)"""
+        return self.get_queryset()
+
+    def perform_read(self, user_profile):
+        unread_counter.invalidate(user_profile.pk)
+
+
+def _filter_read(queryset, anchors, data):
+    """
+    Zawęża `queryset` według MarkReadSerializer: do `ids` i/lub elementów nie nowszych niż element `upTo`
+    z `anchors` (klucz create_date, id jak w stronicowaniu kursorem).
+    """
+    serializer = MarkReadSerializer(data=data)
+    serializer.is_valid(raise_exception=True)
+    if 'ids' in serializer.validated_data:
+        queryset = queryset.filter(pk__in=serializer.validated_data['ids'])
+    if 'up_to' in serializer.validated_data:
+        last = anchors.filter(pk=serializer.validated_data['up_to']).values('create_date', 'id').first()
+        if last is None:
+            raise ValidationError({'upTo': ['Nie ma takiego elementu.']})
+        queryset = queryset.filter(Q(create_date__lt=last['create_date']) |
+                                   Q(create_date=last['create_date'], id__lte=last['id']))
+    return queryset
+
+
+class UnreadMessagesViewSet(MetricsMixin, BulkReadMixin, QueryPlanMixin, ModelViewSet):
     serializer_class = MessageSerializer
+    select_related_extra = ('sender__user', 'reciver__user')
     permission_classes = (IsAuthenticated, )
-    http_method_names = ('get', 'options', 'patch')
+    http_method_names = ('get', 'options', 'patch', 'post')
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        return Message.objects.filter(reciver__user=self.request.user, is_read=False).select_related('reciver__user',
-                                                                                                     'sender__user')
+        return Message.objects.filter(reciver__user=self.request.user, is_read=False)
+
+    def get_read_anchors(self):
+        return Message.objects.filter(reciver__user=self.request.user)
+
+    def perform_read(self, user_profile):
+        Conversation.objects.refresh_unread(owner_id=user_profile.pk)
+        super(UnreadMessagesViewSet, self).perform_read(user_profile)
 
 
-class ReportedPostViewSet(ModelViewSet):
-    queryset = ReportedPost.objects.all()
+class ReportedPostViewSet(MetricsMixin, QueryPlanMixin, ModelViewSet):
+    queryset = ReportedPost.objects.order_by('-create_date', '-id')
     serializer_class = ReportedPostSerializer
     permission_classes = (IsAdminOrCreateOnly, )
     http_method_names = ('get', 'options', 'post')
     throttle_classes = (ReportedPostThrottle, )
+    filter_fields = ('is_pending', )
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user.userprofile)
 
 
-class ReportedCommentViewSet(ModelViewSet):
-    queryset = ReportedComment.objects.all()
+class ReportedCommentViewSet(MetricsMixin, QueryPlanMixin, ModelViewSet):
+    queryset = ReportedComment.objects.order_by('-create_date', '-id')
     serializer_class = ReportedCommentSerializer
     permission_classes = (IsAdminOrCreateOnly, )
     http_method_names = ('get', 'options', 'post')
     throttle_classes = (ReportedCommentThrottle, )
+    filter_fields = ('is_pending', )
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user.userprofile)
 
 
-class NotificationViewSet(ModelViewSet):
+class NotificationViewSet(MetricsMixin, BulkReadMixin, QueryPlanMixin, ModelViewSet):
     serializer_class = NotificationSerializer
     permission_classes = (IsAuthenticated, )
-    http_method_names = ('get', 'options')
+    http_method_names = ('get', 'options', 'post')
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         return Notification.objects.filter(user__user=self.request.user)
+
+
+class UnreadCount(MetricsMixin, APIView):
+    permission_classes = (IsAuthenticated, )
+
+    def get(self, request):
+        """Liczba nieprzeczytanych powiadomień i wiadomości, z cache"""
+        return Response(unread_counter.get(request.user.userprofile.pk))
+
+
+class EventStream(MetricsMixin, APIView):
+    """
+    Strumień Server-Sent Events z powiadomieniami zalogowanego użytkownika.
+
+    Połączenie czeka na kolejce subskrypcji bez zapytań do bazy; co `heartbeat` sekund wysyłany jest
+    komentarz podtrzymujący. Wymaga serwera z wątkowymi (lub zielonymi) workerami.
+    """
+    permission_classes = (IsAuthenticated, )
+    renderer_classes = (EventStreamRenderer, JSONRenderer)
+    heartbeat = 15
+
+    def get(self, request):
+        subscription = event_broker.subscribe(request.user.userprofile.pk)
+        response = StreamingHttpResponse(self.stream(subscription), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def stream(self, subscription):
+        if not connection.in_atomic_block:
+            connection.close()
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                event = subscription.get(timeout=self.heartbeat)
+                if event is None:
+                    yield ': ping\n\n'
+                else:
+                    yield 'event: notification\ndata: {}\n\n'.format(json.dumps(event))
+        finally:
+            subscription.close()
+
+
+class EventPoll(MetricsMixin, APIView):
+    """Long-poll: czeka do `timeout` sekund na pierwsze zdarzenie i zwraca wszystkie zebrane"""
+    permission_classes = (IsAuthenticated, )
+    max_timeout = 55
+
+    def get(self, request):
+        try:
+            timeout = min(float(request.query_params.get('timeout', 25)), self.max_timeout)
+        except ValueError:
+            return Response({'timeout': 'Niepoprawna wartość.'}, status=status.HTTP_400_BAD_REQUEST)
+        subscription = event_broker.subscribe(request.user.userprofile.pk)
+        if not connection.in_atomic_block:
+            connection.close()
+        try:
+            events = []
+            event = subscription.get(timeout=max(timeout, 0))
+            while event is not None:
+                events.append(event)
+                event = subscription.get_nowait()
+        finally:
+            subscription.close()
+        return Response(events)
+
+
+class TagViewSet(MetricsMixin, ReadOnlyModelViewSet):
+    queryset = TagCount.objects.all()
+    serializer_class = TagCountSerializer
+    lookup_field = 'tag'
+    pagination_class = LargeResultsSetPagination
+
+
+class Search(MetricsMixin, APIView):
+    """
+    Wyszukiwanie pełnotekstowe postów i komentarzy oraz podpowiedzi nazw użytkowników.
+
+    `type` ogranicza wyniki do jednej grupy (posts, comments, users). Krótkie frazy użytkowników
+    są dopasowywane od początku nazwy, dłuższe w dowolnym miejscu; oba warianty korzystają z indeksu trigramowego.
+    """
+    groups = ('posts', 'comments', 'users')
+    limit = 10
+
+    def get(self, request):
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return Response({'detail': 'Parametr q jest wymagany.'}, status=status.HTTP_400_BAD_REQUEST)
+        group = request.query_params.get('type')
+        if group is not None and group not in self.groups:
+            return Response({'detail': 'Parametr type musi mieć wartość posts, comments albo users.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        context = {'request': request}
+        results = {}
+        if group in (None, 'posts'):
+            posts = Post.objects.search(text).select_related('author__user')[:self.limit]
+            results['posts'] = PostSerializer(posts, many=True, context=context).data
+        if group in (None, 'comments'):
+            comments = Comment.objects.filter(is_active=True).search(text).select_related('author__user', 'post')
+            results['comments'] = CommentSerializer(comments[:self.limit], many=True, context=context).data
+        if group in (None, 'users'):
+            lookup = 'user__username__icontains' if len(text) >= 3 else 'user__username__istartswith'
+            users = UserProfile.objects.filter(**{lookup: text}).select_related('user')\
+                                       .annotate(similarity=TrigramSimilarity('user__username', text))\
+                                       .order_by('-similarity', 'user__username')
+            results['users'] = UserProfileSerializer(users[:self.limit], many=True, context=context).data
+        return Response(results)
+
+
+def metrics(request):
+    """Metryki żądań w formacie tekstowym Prometheusa, dostępne z adresów METRICS['ALLOWED_IPS']"""
+    if request.META.get('REMOTE_ADDR') not in getattr(settings, 'METRICS', {}).get('ALLOWED_IPS', ('127.0.0.1', )):
+        raise Http404
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _positive_int_or_none(value):
+    if value is None:
+        return None
+    value = int(value)
+    if value <= 0:
+        raise ValueError(value)
+    return value
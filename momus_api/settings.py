@@ -37,6 +37,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'momus.middleware.MetricsMiddleware',
+    'momus.middleware.QueryCountMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -44,6 +46,7 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'momus.profiling.ProfilingMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -138,7 +141,7 @@ REST_FRAMEWORK = {
     #     'rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly'
     # ],
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'momus.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_RENDERER_CLASSES': (
@@ -174,3 +177,101 @@ AUTHENTICATION_BACKENDS = (
 
 CORS_ORIGIN_ALLOW_ALL = True
 CORS_ALLOW_CREDENTIALS = True
+
+# Cache
+# Odpowiedzi dla anonimowych można przenieść do współdzielonego backendu,
+# np. 'django.core.cache.backends.filebased.FileBasedCache'.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'momus-responses',
+        'TIMEOUT': 60,
+    },
+}
+RESPONSE_CACHE = 'responses'
+TOKEN_CACHE_TIMEOUT = 60
+
+# Throttling
+# 'database' trzyma liczniki w tabeli współdzielonej przez wszystkie workery,
+# 'cache' używa aliasu CACHE (memcached/redis; LocMemCache tylko w obrębie procesu).
+
+THROTTLE = {
+    'STORE': 'database',
+    'CACHE': 'default',
+    'RATES': {
+        'userprofile': '10/h',
+        'post': '5/h',
+        'favorite': '25/h',
+        'message': '100/h',
+        'comment': '25/h',
+        'vote': '300/h',
+        'reportedpost': '10/h',
+        'reportedcomment': '15/h',
+    },
+}
+
+# Search
+# Konfiguracja tekstowa PostgreSQL dla wektorów wyszukiwania (po zmianie trzeba przeliczyć wektory).
+
+SEARCH_CONFIG = 'simple'
+
+# Load testing
+# Nagłówek X-Query-Count z liczbą zapytań SQL na żądanie, odczytywany przez `manage.py load_test`.
+
+QUERY_COUNT_HEADER = DEBUG
+
+# Metrics
+# Histogramy czasów i liczby zapytań SQL per endpoint, eksportowane pod /metrics dla Prometheusa.
+# Przy wielu procesach (gunicorn) DIRECTORY wskazuje wspólny katalog na pliki metryk procesów.
+# Włączenie loguje każde zapytanie SQL (jak DEBUG), co samo kosztuje, więc domyślnie jest wyłączone.
+
+METRICS = {
+    'ENABLED': False,
+    'DIRECTORY': None,
+    'FLUSH_INTERVAL': 5,
+    'SLOW_REQUEST_MS': 500,
+    'ALLOWED_IPS': ('127.0.0.1', ),
+}
+
+# Profiling
+# cProfile dla części żądań: SAMPLE_RATE dla wszystkich tras, ROUTES nadpisuje je per trasa z metryk
+# (np. {'MessageViewSet.list': 0.05}); administrator wymusza profil nagłówkiem HEADER.
+# Zapisane profile (najwyżej MAX_PROFILES) są do pobrania w /admin/profiles/.
+
+PROFILING = {
+    'ENABLED': True,
+    'DIRECTORY': os.path.join(BASE_DIR, 'profiles'),
+    'MAX_PROFILES': 200,
+    'SAMPLE_RATE': 0.0,
+    'ROUTES': {},
+    'HEADER': 'X-Profile',
+}
+
+# Notifications
+# Bufor w pamięci procesu traci powiadomienia z ostatnich MAX_DELAY sekund przy restarcie workera;
+# trwały jest tylko SPOOL_DIR (pliki zapisywane do bazy przez `manage.py drain_notifications`).
+
+NOTIFICATION_QUEUE = {
+    'MAX_SIZE': 100,
+    'MAX_DELAY': 2,
+    'SPOOL_DIR': None,
+}
+
+# Events
+# 'local' rozsyła zdarzenia tylko w obrębie procesu (wystarcza przy jednym workerze).
+# 'postgres' rozsyła je między procesami przez LISTEN/NOTIFY kosztem stałego połączenia nasłuchującego
+# w każdym procesie - do włączenia przy wielu workerach (oraz przy SPOOL_DIR powiadomień).
+
+EVENT_BROKER = 'local'
+
+# Images
+
+IMAGE_PIPELINE = {
+    'VARIANTS': (('thumbnail', 320), ('medium', 1080)),
+    'MAX_WORKERS': 2,
+    'WEBP_QUALITY': 80,
+}
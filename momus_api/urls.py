@@ -3,13 +3,19 @@ from django.contrib import admin
 from django.conf.urls.static import static
 from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 
+from momus.admin import profiles, profile_download
+from momus.views import metrics
 from momus_api import settings
 
 urlpatterns = [
     url(r'api/', include('momus.urls')),
     url(r'^auth/', include('rest_auth.urls')),
     url(r'^auth/registration/', include('rest_auth.registration.urls')),
+    url(r'^admin/profiles/$', admin.site.admin_view(profiles), name='profiles'),
+    url(r'^admin/profiles/(?P<profile_id>[\w-]+)\.prof$', admin.site.admin_view(profile_download),
+        name='profile-download'),
     url(r'^admin/', admin.site.urls),
+    url(r'^metrics$', metrics),
 ]
 
 urlpatterns += staticfiles_urlpatterns()